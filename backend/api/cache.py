@@ -0,0 +1,109 @@
+import hashlib
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .constants import (INGREDIENTS_VERSION_KEY, RECIPE_VERSION_KEY,
+                        RESPONSE_CACHE_TIMEOUT, TAG_VERSION_KEY,
+                        USER_VERSION_KEY, VERSION_TIMEOUT)
+
+
+def get_version(key: str) -> int:
+    """
+    Возвращает текущую версию данных по ключу.
+    Начальное значение берется от времени, чтобы после вытеснения ключа
+    из кэша версия не совпала с уже выданной ранее. Версия живет
+    VERSION_TIMEOUT: если сброс версии не дошел до кэша, устаревшие
+    данные перестанут отдаваться не позже, чем через это время.
+    """
+
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key: str) -> None:
+    """
+    Меняет версию данных по ключу на новую, взятую от времени.
+    В отличие от incr запись атомарна на любом бэкенде кэша:
+    при одновременных сбросах версия все равно станет новой.
+    """
+
+    cache.set(key, time.time_ns(), VERSION_TIMEOUT)
+
+
+def invalidate(key: str) -> None:
+    """
+    Сбрасывает версию сразу и еще раз после фиксации транзакции:
+    читатель, успевший пересобрать данные до коммита, не закрепит
+    в кэше устаревшее состояние под новой версией.
+    """
+
+    bump_version(key)
+    transaction.on_commit(lambda: bump_version(key))
+
+
+def get_versions(keys: Iterable[str]) -> Dict[str, int]:
+    """Возвращает версии для набора ключей одним запросом к кэшу."""
+
+    keys = list(keys)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = get_version(key)
+    return versions
+
+
+def get_response_cache_key(request, prefix: str) -> str:
+    """Ключ кэша ответа по хосту и нормализованной строке запроса."""
+
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values if value)
+    raw_key = f'{request.get_host()}?{urlencode(params)}'
+    return f'{prefix}:{hashlib.md5(raw_key.encode()).hexdigest()}'
+
+
+def get_cached_response(key: str) -> Optional[Any]:
+    """
+    Возвращает сохраненные данные ответа, если версии всех данных,
+    от которых он зависит, не изменились.
+    """
+
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    dependencies, data = entry
+    if get_versions(dependencies) != dependencies:
+        return None
+    return data
+
+
+def set_cached_response(key: str, data: Any,
+                        dependencies: Iterable[str]) -> None:
+    """
+    Сохраняет данные ответа вместе с текущими версиями зависимостей.
+    Ответ, собранный одновременно с изменением данных, живет в кэше
+    не дольше RESPONSE_CACHE_TIMEOUT.
+    """
+
+    cache.set(key, (get_versions(dependencies), data),
+              RESPONSE_CACHE_TIMEOUT)
+
+
+def get_recipe_dependencies(recipes: Iterable[Dict]) -> Set[str]:
+    """Ключи версий данных, из которых собраны сериализованные рецепты."""
+
+    dependencies = {INGREDIENTS_VERSION_KEY}
+    for recipe in recipes:
+        dependencies.add(RECIPE_VERSION_KEY.format(recipe['id']))
+        dependencies.add(USER_VERSION_KEY.format(recipe['author']['id']))
+        dependencies.update(
+            TAG_VERSION_KEY.format(tag['id']) for tag in recipe['tags'])
+    return dependencies
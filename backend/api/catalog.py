@@ -0,0 +1,72 @@
+import gzip
+import re
+import threading
+from typing import Callable, List, Tuple
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from recipes.models import Ingredient, Tag
+from rest_framework.renderers import JSONRenderer
+
+from .cache import get_version
+from .constants import INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY
+from .serializers import IngredientsSerializer, TagSerializer
+
+GZIP_PATTERN = re.compile(r'\bgzip\b')
+
+
+class PrerenderedCatalog:
+    """
+    Справочник (теги, ингредиенты), заранее отрисованный в JSON и gzip
+    и хранящийся в памяти процесса. Ответ отдается без запросов к БД
+    и сериализации, с ETag по версии справочника; на If-None-Match
+    с той же версией отдается 304. Данные пересобираются только при
+    изменении версии.
+    """
+
+    def __init__(self, version_key: str, build: Callable[[], List]):
+        self.version_key = version_key
+        self.build = build
+        self._lock = threading.Lock()
+        self._version = None
+        self._data: Tuple[str, bytes, bytes] = ('', b'', b'')
+
+    def _refresh(self) -> None:
+        version = get_version(self.version_key)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                body = JSONRenderer().render(self.build())
+                self._data = (f'{self.version_key}-{version}', body,
+                              gzip.compress(body, mtime=0))
+                self._version = version
+
+    def get_response(self, request) -> HttpResponse:
+        self._refresh()
+        tag, body, compressed = self._data
+        use_gzip = bool(GZIP_PATTERN.search(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        etag = f'"{tag}-gzip"' if use_gzip else f'"{tag}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(compressed if use_gzip else body,
+                                    content_type='application/json')
+            if use_gzip:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+def build_tags() -> List:
+    return TagSerializer(Tag.objects.all(), many=True).data
+
+
+def build_ingredients() -> List:
+    return IngredientsSerializer(Ingredient.objects.all(), many=True).data
+
+
+tags_catalog = PrerenderedCatalog(TAGS_VERSION_KEY, build_tags)
+ingredients_catalog = PrerenderedCatalog(INGREDIENTS_VERSION_KEY,
+                                         build_ingredients)
@@ -1,2 +1,28 @@
 PAGE_SIZE = 6
 MAX_PAGE_SIZE = 20
+INGREDIENT_SEARCH_LIMIT = 50
+MAX_INGREDIENT_SEARCH_LIMIT = 200
+INGREDIENTS_VERSION_KEY = 'ingredients-version'
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+RECIPES_VERSION_KEY = 'recipes-version'
+RECIPE_VERSION_KEY = 'recipe-version:{}'
+TAG_VERSION_KEY = 'tag-version:{}'
+TAGS_VERSION_KEY = 'tags-version'
+USER_VERSION_KEY = 'user-version:{}'
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+VERSION_TIMEOUT = 60 * 60
+CACHEABLE_RECIPE_PARAMS = {'page', 'limit', 'cursor', 'tags', 'author',
+                           'ordering'}
+# Счетчики меняются через UPDATE без сброса версий рецептов, поэтому
+# страницы, отсортированные по ним, не кэшируются.
+UNCACHEABLE_ORDERING_FIELDS = {'favorites_count'}
+USER_RELATIONS_VERSION_KEY = 'user-relations-version:{}'
+# Запас на текстовые поля формы сверх размера изображения.
+MAX_UPLOAD_OVERHEAD = 1024 * 1024
+MAX_BATCH_SIZE = 100
+CONDITIONAL_HEADERS = ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+BENCH_REQUESTS = 200
+BENCH_CONCURRENCY = 8
+BENCH_TIMEOUT = 30
+# Число первых страниц списка рецептов, по которым ходит bench_api.
+BENCH_PAGES = 5
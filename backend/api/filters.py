@@ -1,18 +1,12 @@
 import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+from recipes.constants import SEARCH_CONFIG
 from recipes.models import Recipe
 from rest_framework import filters
 
 
-class IngredientsSearch(filters.BaseFilterBackend):
-    """Поиск по вхождению в начало имени ингредиента."""
-
-    def filter_queryset(self, request, queryset, view):
-        search_query = request.query_params.get('name', None)
-        if search_query:
-            queryset = queryset.filter(name__istartswith=search_query)
-        return queryset
-
-
 class RecipeFilter(django_filters.FilterSet):
     """Фильтры по тегам и автору рецепта для запросов к ресурсу recipes."""
 
@@ -51,3 +45,30 @@ class CustomFilterBackend(filters.BaseFilterBackend):
                 queryset = queryset.filter(buylist__user=user)
 
         return queryset
+
+
+class RecipeSearch(filters.BaseFilterBackend):
+    """
+    Полнотекстовый поиск рецептов по названию, описанию, тегам
+    и ингредиентам (?search=). На PostgreSQL ищет по tsvector
+    с GIN-индексом и сортирует по релевантности, на других БД
+    проверяет вхождение каждого слова в поисковый документ.
+    """
+
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        search_query = request.query_params.get(self.search_param, '').strip()
+        if not search_query:
+            return queryset
+
+        if connection.vendor != 'postgresql':
+            for term in search_query.casefold().split():
+                queryset = queryset.filter(search_document__contains=term)
+            return queryset
+
+        query = SearchQuery(search_query, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', *queryset.query.order_by)
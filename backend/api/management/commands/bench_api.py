@@ -0,0 +1,264 @@
+"""
+Нагрузочный тест API на запущенном сервере:
+python manage.py bench_api --base-url http://127.0.0.1:8000
+Каждый сценарий выполняется --requests раз в --concurrency потоков,
+у каждого потока свое keep-alive соединение. Для сценариев
+с авторизацией нужен пользователь --email/--password, по умолчанию -
+первый пользователь seed_synthetic. Выводятся пропускная способность,
+задержки p50/p95/p99 и среднее число запросов к БД на запрос
+(заголовок X-DB-Queries, сервер должен работать
+с QUERY_COUNT_HEADERS=1).
+Результаты с хешем коммита пишутся в JSON файл --output, чтобы
+сравнивать прогоны между коммитами.
+"""
+
+import http.client
+import json
+import math
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from statistics import mean
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import quote, urlsplit
+
+from api.constants import (BENCH_CONCURRENCY, BENCH_PAGES, BENCH_REQUESTS,
+                           BENCH_TIMEOUT, MAX_PAGE_SIZE, PAGE_SIZE)
+from django.core.management.base import BaseCommand, CommandError
+
+SCENARIOS = (
+    'recipes_list', 'recipes_list_auth', 'recipes_list_tags',
+    'recipe_detail', 'recipe_detail_auth', 'favorite_toggle',
+    'cart_toggle', 'download_shopping_cart', 'subscriptions',
+    'ingredients_search',
+)
+PERCENTILES = (50, 95, 99)
+
+
+class Sample(NamedTuple):
+    latency: float
+    status: int
+    queries: Optional[int]
+    body: bytes
+
+
+def percentile(values: List[float], rank: int) -> float:
+    """Перцентиль по ближайшему рангу, values отсортированы."""
+
+    return values[max(math.ceil(rank / 100 * len(values)) - 1, 0)]
+
+
+class Client:
+    """HTTP клиент с отдельным keep-alive соединением в каждом потоке."""
+
+    def __init__(self, base_url: str, timeout: float):
+        url = urlsplit(base_url)
+        self.connection_class = (http.client.HTTPSConnection
+                                 if url.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.token = None
+        self.local = threading.local()
+
+    def _get_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.connection_class(self.netloc,
+                                               timeout=self.timeout)
+            self.local.connection = connection
+        return connection
+
+    def request(self, method: str, path: str, auth: bool = False,
+                data: Optional[Dict] = None) -> Sample:
+        headers = {'Accept': 'application/json'}
+        if auth:
+            headers['Authorization'] = f'Token {self.token}'
+        body = None
+        if data is not None:
+            body = json.dumps(data)
+            headers['Content-Type'] = 'application/json'
+        for _ in range(2):
+            connection = self._get_connection()
+            started = time.perf_counter()
+            try:
+                connection.request(method, self.prefix + path, body, headers)
+                response = connection.getresponse()
+                content = response.read()
+                break
+            except (OSError, http.client.HTTPException):
+                # Сервер мог закрыть простаивавшее соединение: повторяем
+                # запрос один раз на новом.
+                connection.close()
+                self.local.connection = None
+        else:
+            return Sample(time.perf_counter() - started, 0, None, b'')
+        queries = response.getheader('X-DB-Queries')
+        return Sample(time.perf_counter() - started, response.status,
+                      int(queries) if queries else None, content)
+
+    def get_json(self, path: str, auth: bool = False):
+        sample = self.request('GET', path, auth)
+        if sample.status != 200:
+            raise CommandError(f'GET {path}: статус {sample.status}.')
+        return json.loads(sample.body)
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест маршрутов API с перцентилями задержек.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--email', default='synthetic0@example.com')
+        parser.add_argument('--password', default='synthetic-password')
+        parser.add_argument('--requests', type=int, default=BENCH_REQUESTS,
+                            help='Число итераций каждого сценария.')
+        parser.add_argument('--concurrency', type=int,
+                            default=BENCH_CONCURRENCY,
+                            help='Число параллельных клиентов.')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help='Сценарии через запятую.')
+        parser.add_argument('--timeout', type=float, default=BENCH_TIMEOUT)
+        parser.add_argument('--output', default='bench_api.json',
+                            help='Файл для результатов в JSON.')
+
+    def handle(self, *args, **options):
+        scenarios = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные сценарии: {", ".join(sorted(unknown))}.')
+        self.client = Client(options['base_url'], options['timeout'])
+        self._prepare(options['email'], options['password'])
+
+        results = {}
+        for name in scenarios:
+            results[name] = self._run(getattr(self, f'scenario_{name}'),
+                                      options['requests'],
+                                      options['concurrency'])
+            self._print(name, results[name])
+
+        report = {
+            'base_url': options['base_url'],
+            'commit': self._get_commit(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'scenarios': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}.'))
+
+    def _prepare(self, email, password):
+        """Токен пользователя и данные для сценариев."""
+
+        sample = self.client.request('POST', '/api/auth/token/login/',
+                                     data={'email': email,
+                                           'password': password})
+        if sample.status != 200:
+            raise CommandError(
+                f'Не удалось получить токен для {email}: '
+                f'статус {sample.status}.')
+        self.client.token = json.loads(sample.body)['auth_token']
+        recipes = self.client.get_json(f'/api/recipes/?limit={MAX_PAGE_SIZE}')
+        self.recipe_ids = [recipe['id'] for recipe in recipes['results']]
+        if not self.recipe_ids:
+            raise CommandError('Нет рецептов, запустите seed_synthetic.')
+        self.pages = min(BENCH_PAGES, math.ceil(recipes['count'] / PAGE_SIZE))
+        self.tags = [tag['slug']
+                     for tag in self.client.get_json('/api/tags/')]
+        self.prefixes = sorted({
+            ingredient['name'][:2].casefold()
+            for ingredient in self.client.get_json('/api/ingredients/')[:50]
+        }) or ['а']
+
+    def _run(self, scenario, requests, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = [sample for samples in pool.map(scenario,
+                                                      range(requests))
+                       for sample in samples]
+        elapsed = time.perf_counter() - started
+        latencies = sorted(sample.latency * 1000 for sample in samples)
+        queries = [sample.queries for sample in samples
+                   if sample.queries is not None]
+        result = {
+            'requests': len(samples),
+            'errors': sum(not 200 <= sample.status < 300
+                          for sample in samples),
+            'rps': round(len(samples) / elapsed, 1),
+            'mean_ms': round(mean(latencies), 2),
+        }
+        for rank in PERCENTILES:
+            result[f'p{rank}_ms'] = round(percentile(latencies, rank), 2)
+        result['db_queries'] = round(mean(queries), 2) if queries else None
+        return result
+
+    def _print(self, name, result):
+        self.stdout.write(
+            f'{name:<24} {result["rps"]:>8} rps  '
+            + '  '.join(f'p{rank} {result[f"p{rank}_ms"]:>8} мс'
+                        for rank in PERCENTILES)
+            + f'  БД {result["db_queries"]}  ошибок {result["errors"]}')
+
+    def _get_commit(self):
+        try:
+            return subprocess.run(
+                ('git', 'rev-parse', '--short', 'HEAD'), capture_output=True,
+                text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _recipe_id(self, i):
+        return self.recipe_ids[i % len(self.recipe_ids)]
+
+    def scenario_recipes_list(self, i):
+        return [self.client.request(
+            'GET', f'/api/recipes/?page={i % self.pages + 1}')]
+
+    def scenario_recipes_list_auth(self, i):
+        return [self.client.request(
+            'GET', f'/api/recipes/?page={i % self.pages + 1}', auth=True)]
+
+    def scenario_recipes_list_tags(self, i):
+        path = '/api/recipes/'
+        if self.tags:
+            path += f'?tags={quote(self.tags[i % len(self.tags)])}'
+        return [self.client.request('GET', path)]
+
+    def scenario_recipe_detail(self, i):
+        return [self.client.request(
+            'GET', f'/api/recipes/{self._recipe_id(i)}/')]
+
+    def scenario_recipe_detail_auth(self, i):
+        return [self.client.request(
+            'GET', f'/api/recipes/{self._recipe_id(i)}/', auth=True)]
+
+    def _toggle(self, relation, i):
+        path = f'/api/recipes/{self._recipe_id(i)}/{relation}/'
+        return [self.client.request('POST', path, auth=True),
+                self.client.request('DELETE', path, auth=True)]
+
+    def scenario_favorite_toggle(self, i):
+        return self._toggle('favorite', i)
+
+    def scenario_cart_toggle(self, i):
+        return self._toggle('shopping_cart', i)
+
+    def scenario_download_shopping_cart(self, i):
+        return [self.client.request(
+            'GET', '/api/recipes/download_shopping_cart/', auth=True)]
+
+    def scenario_subscriptions(self, i):
+        return [self.client.request(
+            'GET', '/api/users/subscriptions/?recipes_limit=3', auth=True)]
+
+    def scenario_ingredients_search(self, i):
+        prefix = self.prefixes[i % len(self.prefixes)]
+        return [self.client.request(
+            'GET', f'/api/ingredients/?name={quote(prefix)}')]
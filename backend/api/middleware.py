@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.db import connection
+
+
+class QueryCounter:
+    """Обертка выполнения SQL: считает запросы и их суммарное время."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - started
+
+
+class QueryCountMiddleware:
+    """
+    При settings.QUERY_COUNT_HEADERS добавляет к ответу число запросов
+    к БД и их время в секундах (X-DB-Queries, X-DB-Time), их читает
+    команда bench_api.
+    Запросы потоковых ответов, выполненные при отдаче тела, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_COUNT_HEADERS:
+            return self.get_response(request)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        response['X-DB-Queries'] = counter.count
+        response['X-DB-Time'] = f'{counter.time:.6f}'
+        return response
@@ -1,12 +1,108 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from .constants import MAX_PAGE_SIZE, PAGE_SIZE
 
 
 class CustomPagination(pagination.PageNumberPagination):
-    """Класс пагинатора с параметрами page и limit."""
+    """
+    Класс пагинатора с параметрами page и limit.
+    Если передан параметр cursor и у представления задан cursor_ordering,
+    страница выбирается по ключу сортировки (keyset) без OFFSET и COUNT:
+    стоимость любой страницы такая же, как у первой. Пустой cursor
+    означает первую страницу, ссылка на следующую приходит в next.
+    """
 
     page_query_param = 'page'
     page_size_query_param = 'limit'
     page_size = PAGE_SIZE
     max_page_size = MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def _use_cursor(self, queryset, request, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        return (self.cursor_query_param in request.query_params
+                and ordering is not None
+                and queryset.query.order_by in ((), tuple(ordering)))
+
+    def _decode_cursor(self, queryset, cursor):
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                queryset.model._meta.get_field(
+                    field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _encode_cursor(self, instance):
+        values = [getattr(instance, field.lstrip('-'))
+                  for field in self.ordering]
+        return base64.urlsafe_b64encode(
+            json.dumps(values, default=str).encode()).decode()
+
+    def _get_seek_filter(self, position):
+        """
+        Условие «строго после позиции» для сортировки по нескольким полям:
+        (f1 > v1) OR (f1 = v1 AND f2 > v2) ... с учетом направления.
+        """
+
+        seek_filter = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            seek_filter |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return seek_filter
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self._use_cursor(queryset, request, view)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = view.cursor_ordering
+        page_size = self.get_page_size(request)
+        position = self._decode_cursor(
+            queryset, request.query_params[self.cursor_query_param])
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self._get_seek_filter(position))
+        results = list(queryset[:page_size + 1])
+        self.next_instance = (results[page_size - 1]
+                              if len(results) > page_size else None)
+        return results[:page_size]
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_instance is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param,
+                                   self._encode_cursor(self.next_instance))
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
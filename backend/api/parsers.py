@@ -0,0 +1,52 @@
+import re
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from recipes.constants import MAX_IMAGE_SIZE
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+
+from .constants import MAX_UPLOAD_OVERHEAD
+
+IMAGE_SIGNATURE = re.compile(
+    rb'\xff\xd8\xff|\x89PNG\r\n\x1a\n|GIF8[79]a|RIFF.{4}WEBP', re.DOTALL)
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет файлы формы во временный файл на диске порциями, поэтому
+    в памяти держится только текущая порция. Запрос с телом больше
+    допустимого отклоняется до чтения, файл не изображения - по первым
+    байтам, слишком большой файл - как только превышен лимит.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > MAX_IMAGE_SIZE + MAX_UPLOAD_OVERHEAD:
+            raise ValidationError(
+                {'image': ['Слишком большой размер запроса.']})
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.field_name = field_name
+
+    def _reject(self, message):
+        self.file.close()
+        raise ValidationError({self.field_name: [message]})
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not IMAGE_SIGNATURE.match(raw_data):
+            self._reject('Загрузите изображение JPEG, PNG, GIF или WebP.')
+        if start + len(raw_data) > MAX_IMAGE_SIZE:
+            self._reject(f'Размер изображения больше '
+                         f'{MAX_IMAGE_SIZE // 1024 // 1024} МБ.')
+        return super().receive_data_chunk(raw_data, start)
+
+
+class ImageMultiPartParser(MultiPartParser):
+    """Разбор multipart/form-data с проверкой файлов ImageUploadHandler."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        request._request.upload_handlers = [
+            ImageUploadHandler(request._request)]
+        return super().parse(stream, media_type, parser_context)
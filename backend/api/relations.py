@@ -0,0 +1,78 @@
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from recipes.models import BuyList, Favorite
+from users.models import Subscription
+
+from .cache import get_version
+from .constants import RESPONSE_CACHE_TIMEOUT, USER_RELATIONS_VERSION_KEY
+
+
+class UserRelations:
+    """
+    Наборы id рецептов в избранном и в корзине пользователя и id авторов,
+    на которых он подписан. Загружаются один раз на запрос и хранятся
+    в кэше до изменения версии связей пользователя.
+    Без пользователя все наборы пустые.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+
+    @cached_property
+    def _sets(self) -> Tuple[FrozenSet[int], FrozenSet[int], FrozenSet[int]]:
+        if self.user is None or not self.user.is_authenticated:
+            return frozenset(), frozenset(), frozenset()
+        version = get_version(USER_RELATIONS_VERSION_KEY.format(self.user.id))
+        key = f'user-relations:{self.user.id}:{version}'
+        sets = cache.get(key)
+        if sets is None:
+            sets = (
+                frozenset(Favorite.objects.filter(
+                    user=self.user).values_list('recipe_id', flat=True)),
+                frozenset(BuyList.objects.filter(
+                    user=self.user).values_list('recipe_id', flat=True)),
+                frozenset(Subscription.objects.filter(
+                    user=self.user).values_list('author_id', flat=True)),
+            )
+            cache.set(key, sets, RESPONSE_CACHE_TIMEOUT)
+        return sets
+
+    @property
+    def favorites(self) -> FrozenSet[int]:
+        return self._sets[0]
+
+    @property
+    def cart(self) -> FrozenSet[int]:
+        return self._sets[1]
+
+    @property
+    def subscriptions(self) -> FrozenSet[int]:
+        return self._sets[2]
+
+
+def get_user_relations(context: Dict) -> UserRelations:
+    """
+    Возвращает связи пользователя из контекста сериализатора.
+    Вложенные сериализаторы используют контекст корневого, поэтому
+    связи загружаются один раз на весь ответ.
+    """
+
+    relations = context.get('user_relations')
+    if relations is None:
+        request = context.get('request')
+        relations = UserRelations(request.user if request else None)
+        context['user_relations'] = relations
+    return relations
+
+
+def apply_user_relations(recipes: Iterable[Dict],
+                         relations: UserRelations) -> None:
+    """Проставляет в сериализованные рецепты флаги пользователя."""
+
+    for recipe in recipes:
+        recipe['is_favorited'] = recipe['id'] in relations.favorites
+        recipe['is_in_shopping_cart'] = recipe['id'] in relations.cart
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in relations.subscriptions)
@@ -0,0 +1,127 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from recipes.models import Ingredient
+
+from .cache import get_version
+from .constants import INGREDIENTS_VERSION_KEY, TRIGRAM_SIMILARITY_THRESHOLD
+
+PREFIX_UPPER_BOUND = chr(0x10FFFF)
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def get_trigrams(text: str) -> Set[str]:
+    """
+    Разбивает строку на триграммы так же, как pg_trgm: каждое слово
+    приводится к нижнему регистру и дополняется пробелами по краям.
+    """
+
+    trigrams = set()
+    for word in WORD_PATTERN.findall(text.casefold()):
+        padded = f'  {word} '
+        trigrams.update(
+            padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+    Хранит отсортированный массив имен в casefold и отвечает на поиск
+    по началу имени бинарным поиском, без обращения к БД.
+    Для нечеткого поиска хранит обратный индекс триграмм: на PostgreSQL
+    вместо него используется GIN-индекс pg_trgm.
+    Индекс пересобирается при изменении версии каталога ингредиентов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data: Tuple[List[str], List[Dict],
+                          Dict[str, List[int]], List[int]] = ([], [], {}, [])
+
+    def _build(self) -> None:
+        ingredients = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda row: (row['name'].casefold(), row['id']))
+        keys = [row['name'].casefold() for row in ingredients]
+        trigrams = defaultdict(list)
+        trigram_counts = []
+        for position, key in enumerate(keys):
+            key_trigrams = get_trigrams(key)
+            for trigram in key_trigrams:
+                trigrams[trigram].append(position)
+            trigram_counts.append(len(key_trigrams))
+        self._data = (keys, ingredients, dict(trigrams), trigram_counts)
+
+    def _refresh(self) -> None:
+        version = get_version(INGREDIENTS_VERSION_KEY)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._build()
+                self._version = version
+
+    def _similar_in_memory(self, query: str, exclude: Set[int],
+                           limit: Optional[int]) -> List[Dict]:
+        keys, rows, trigrams, trigram_counts = self._data
+        query_trigrams = get_trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(trigrams.get(trigram, ()))
+        ranked = []
+        for position, common in shared.items():
+            if rows[position]['id'] in exclude:
+                continue
+            similarity = common / (len(query_trigrams)
+                                   + trigram_counts[position] - common)
+            if similarity >= TRIGRAM_SIMILARITY_THRESHOLD:
+                ranked.append((-similarity, len(keys[position]), position))
+        ranked.sort()
+        return [rows[position] for *_, position in ranked[:limit]]
+
+    def _similar_in_db(self, query: str, exclude: Set[int],
+                       limit: Optional[int]) -> List[Dict]:
+        queryset = Ingredient.objects.filter(
+            name__trigram_similar=query
+        ).exclude(id__in=exclude).annotate(
+            similarity=TrigramSimilarity('name', query)
+        ).order_by('-similarity', 'id').values(
+            'id', 'name', 'measurement_unit')
+        return list(queryset[:limit])
+
+    def search(self, query: str, limit: Optional[int] = None,
+               fuzzy: bool = False) -> List[Dict]:
+        """
+        Возвращает ингредиенты, имя которых начинается с query.
+        Сначала точное совпадение, затем более короткие имена.
+        При fuzzy=True результат дополняется похожими по триграммам
+        именами в порядке убывания сходства.
+        """
+
+        self._refresh()
+        keys, rows, *_ = self._data
+        query = query.casefold()
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + PREFIX_UPPER_BOUND, lo=start)
+        found = sorted(
+            range(start, end),
+            key=lambda i: (keys[i] != query, len(keys[i]), i))
+        result = [rows[i] for i in found[:limit]]
+        if not fuzzy or (limit is not None and len(result) >= limit):
+            return result
+
+        exclude = {row['id'] for row in result}
+        rest = None if limit is None else limit - len(result)
+        if connection.vendor == 'postgresql':
+            return result + self._similar_in_db(query, exclude, rest)
+        return result + self._similar_in_memory(query, exclude, rest)
+
+
+ingredient_index = IngredientIndex()
@@ -1,22 +1,31 @@
 import base64
 import binascii
+import json
 
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
 from django.db import transaction
 from django.db.models import Q
+from django.http import QueryDict
 from djoser.serializers import UserCreateSerializer, UserSerializer
+from recipes.batch import lock_user
+from recipes.cart import change_recipe_in_carts, get_amounts_delta
 from recipes.constants import (MAX_AMOUNT_INGREDIENT, MAX_COOKING_TIME,
                                MIN_AMOUNT_INGREDIENT, MIN_COOKING_TIME)
+from recipes.duplicates import find_duplicate
+from recipes.images import get_image_url, get_image_urls
 from recipes.models import (BuyList, Favorite, Ingredient, IngredientRecipe,
                             Recipe, Tag)
+from recipes.signals import recipe_change
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from users.models import Subscription
 
-from .validators import validate_number, validate_unique_for_list
+from .constants import MAX_BATCH_SIZE
+from .relations import get_user_relations
+from .validators import (validate_image_size, validate_number,
+                         validate_unique_for_list)
 
 User = get_user_model()
 
@@ -34,7 +43,24 @@ class Base64ImageField(serializers.ImageField):
                 data = ContentFile(decoded_image, name=file_name)
             except (ValueError, TypeError, binascii.Error):
                 raise serializers.ValidationError('Invalid base64 format')
-        return super().to_internal_value(data)
+        image = super().to_internal_value(data)
+        validate_image_size(image)
+        return image
+
+
+class RecipeImageField(serializers.ReadOnlyField):
+    """
+    Ссылка на уменьшенную копию фото рецепта в формате JPEG.
+    Пока фото не обработано, отдается ссылка на оригинал.
+    """
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return get_image_url(recipe, self.variant)
 
 
 class CustomUserSerializer(UserSerializer):
@@ -48,9 +74,7 @@ class CustomUserSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return (user.is_authenticated and obj.subscribed.filter(
-            user=user).exists())
+        return obj.id in get_user_relations(self.context).subscriptions
 
 
 class IngredientsSerializer(serializers.ModelSerializer):
@@ -93,9 +117,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
         many=True, source='recipe_ingredients')
-    is_favorited = serializers.BooleanField(read_only=True, default=False)
-    is_in_shopping_cart = serializers.BooleanField(read_only=True,
-                                                   default=False)
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -103,6 +126,12 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'is_in_shopping_cart', 'name', 'image', 'text',
                   'cooking_time')
 
+    def get_is_favorited(self, obj):
+        return obj.id in get_user_relations(self.context).favorites
+
+    def get_is_in_shopping_cart(self, obj):
+        return obj.id in get_user_relations(self.context).cart
+
     def _create_ingredients(self, recipe, ingredients_data):
         ingredients = [
             IngredientRecipe(recipe=recipe,
@@ -113,63 +142,143 @@ class RecipeSerializer(serializers.ModelSerializer):
         IngredientRecipe.objects.bulk_create(ingredients)
 
     def create(self, validated_data):
+        """Поисковый индекс и отпечаток собираются один раз в конце."""
+
         ingredients_data = validated_data.pop('recipe_ingredients')
         tags = validated_data.pop('tag')
-        with transaction.atomic():
-            recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe(**validated_data)
+        with transaction.atomic(), recipe_change(recipe):
+            recipe.save()
             self._create_ingredients(recipe, ingredients_data)
             recipe.tag.set(tags)
         return recipe
 
+    def _is_same_image(self, instance, image):
+        """Совпадает ли загруженный файл с текущим фото рецепта."""
+
+        field = instance.image.field
+        return instance.image.name == field.storage.get_content_name(
+            field.generate_filename(instance, image.name), image)
+
+    def _update_ingredients(self, recipe, ingredients_data):
+        """
+        Сравнивает новый состав с текущими строками рецепта и пишет
+        только разницу: добавленные, измененные и удаленные строки.
+        Корзины с рецептом меняются на ту же разницу количеств.
+        """
+
+        current = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.select_for_update().filter(
+                recipe=recipe)
+        }
+        previous = {ingredient_id: row.amount
+                    for ingredient_id, row in current.items()}
+        amounts = {data['ingredient'].id: data['amount']
+                   for data in ingredients_data}
+
+        deleted = [row.id for ingredient_id, row in current.items()
+                   if ingredient_id not in amounts]
+        changed = []
+        created = []
+        for ingredient_id, amount in amounts.items():
+            row = current.get(ingredient_id)
+            if row is None:
+                created.append(IngredientRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id,
+                    amount=amount))
+            elif row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+
+        if deleted:
+            IngredientRecipe.objects.filter(id__in=deleted).delete()
+        IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        IngredientRecipe.objects.bulk_create(created)
+        change_recipe_in_carts(recipe.id, get_amounts_delta(previous, amounts))
+
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tag', [])
-        ingredients_data = validated_data.pop('recipe_ingredients', [])
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get('cooking_time',
-                                                   instance.cooking_time)
-        instance.image = validated_data.get('image', instance.image)
-        instance.save()
-        instance.tag.set(tags)
-        with transaction.atomic():
-            instance.recipe_ingredients.all().delete()
-            self._create_ingredients(instance, ingredients_data)
+        """
+        PATCH меняет только переданные поля. Теги и ингредиенты
+        сравниваются с текущими, поэтому правка одного количества
+        обновляет одну строку. Поисковый индекс и отпечаток
+        пересобираются один раз после всех изменений.
+        """
+
+        tags = validated_data.pop('tag', None)
+        ingredients_data = validated_data.pop('recipe_ingredients', None)
+        image = validated_data.pop('image', None)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        if image is not None and not self._is_same_image(instance, image):
+            instance.image = image
+        with transaction.atomic(), recipe_change(instance):
+            if ingredients_data is not None:
+                self._update_ingredients(instance, ingredients_data)
+            if tags is not None:
+                instance.tag.set(tags)
+            instance.save()
         return instance
 
+    def to_internal_value(self, data):
+        """
+        В multipart/form-data фото передается файлом, теги - повторяющимся
+        полем tags, а ингредиенты - строкой со списком в формате JSON.
+        """
+
+        if isinstance(data, QueryDict):
+            form = data
+            data = form.dict()
+            if 'tags' in form:
+                data['tags'] = form.getlist('tags')
+            if 'ingredients' in form:
+                try:
+                    data['ingredients'] = json.loads(form['ingredients'])
+                except ValueError:
+                    raise ValidationError({'ingredients': [
+                        'Ожидается список ингредиентов в формате JSON.']})
+        return super().to_internal_value(data)
+
     def validate(self, attrs):
+        """При PATCH проверяются только переданные поля."""
+
         attrs = super().validate(attrs)
         tags = attrs.get('tag')
-        name = attrs['name']
-        ingredients = attrs['recipe_ingredients']
-        ingredients_obj = [ingred['ingredient'] for ingred in ingredients]
-        ingredients_amount = [ingred['amount'] for ingred in ingredients]
-        cooking_time = attrs['cooking_time']
-        author = self.context['request'].user
-        method = self.context['request'].method
-
-        if not tags:
+        ingredients = attrs.get('recipe_ingredients')
+        request = self.context['request']
+        check_tags = not self.partial or 'tag' in attrs
+        check_ingredients = (not self.partial
+                             or 'recipe_ingredients' in attrs)
+
+        if check_tags and not tags:
             raise serializers.ValidationError(
                 'Поле "tags" должно содержать хотя бы один элемент.')
 
-        if not ingredients:
+        if check_ingredients and not ingredients:
             raise serializers.ValidationError(
                 'Поле "ingredients" не должно быть пустым списком.')
 
-        if (method == 'POST' and Recipe.objects.filter(
-                name=name, author=author, tag__in=tags).exists()):
+        if request.method == 'POST' and find_duplicate(
+                request.user, attrs['name'], [tag.id for tag in tags]):
             raise ValidationError(
                 'У вас уже есть рецепт с таким названием и тегами.')
 
-        validate_unique_for_list('Теги', tags)
-        validate_unique_for_list('Ингредиенты', ingredients_obj)
-        validate_number(
-            'Время приготовления',
-            cooking_time, MAX_COOKING_TIME, MIN_COOKING_TIME)
+        if check_tags:
+            validate_unique_for_list('Теги', tags)
+        if check_ingredients:
+            validate_unique_for_list(
+                'Ингредиенты',
+                [ingredient['ingredient'] for ingredient in ingredients])
+        if 'cooking_time' in attrs:
+            validate_number(
+                'Время приготовления',
+                attrs['cooking_time'], MAX_COOKING_TIME, MIN_COOKING_TIME)
 
-        for amount in ingredients_amount:
+        for ingredient in ingredients or ():
             validate_number(
                 'Количество',
-                amount, MAX_AMOUNT_INGREDIENT, MIN_AMOUNT_INGREDIENT)
+                ingredient['amount'], MAX_AMOUNT_INGREDIENT,
+                MIN_AMOUNT_INGREDIENT)
 
         return attrs
 
@@ -179,8 +288,9 @@ class RecipeSerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
         tags = instance.tag.all()
         representation['tags'] = TagSerializer(tags, many=True).data
-        media_url = settings.MEDIA_URL
-        representation['image'] = media_url + str(instance.image)
+        representation['image'] = get_image_url(
+            instance, self.context.get('image_variant', 'full'))
+        representation['images'] = get_image_urls(instance)
         return representation
 
 
@@ -191,6 +301,8 @@ class RepresentBaseRecipeSerializer(serializers.ModelSerializer):
     для добавления рецептов на разные страницы.
     """
 
+    image = RecipeImageField('thumbnail')
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
@@ -209,14 +321,16 @@ class BaseAddRecipeSerializer(serializers.ModelSerializer):
         fields = ('__all__')
         read_only_fields = ('user', 'recipe')
 
-    def validate(self, attrs):
+    def _check_not_added(self, user, recipe_id):
         model = self.Meta.model
-        user = self.context['request'].user
-        recipe_id = self.context['recipe_id']
         if model.objects.filter(
                 Q(user=user) & Q(recipe=recipe_id)).exists():
             raise ValidationError(
                 f'Вы уже добавили этот рецепт в {model._meta.verbose_name}.')
+
+    def validate(self, attrs):
+        self._check_not_added(self.context['request'].user,
+                              self.context['recipe_id'])
         return super().validate(attrs)
 
     def create(self, validated_data):
@@ -224,7 +338,12 @@ class BaseAddRecipeSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         recipe_id = self.context['recipe_id']
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        instanse = model.objects.create(user=user, recipe=recipe)
+        with transaction.atomic():
+            # Пакет мог добавить рецепт после validate: проверка
+            # повторяется под блокировкой пользователя.
+            lock_user(user)
+            self._check_not_added(user, recipe.id)
+            instanse = model.objects.create(user=user, recipe=recipe)
         return instanse
 
     def to_representation(self, instance):
@@ -245,6 +364,15 @@ class BuyListSerializer(BaseAddRecipeSerializer):
         model = BuyList
 
 
+class RecipeBatchSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного добавления или удаления."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE)
+
+
 class CustomUserCreateSerializer(UserCreateSerializer):
     """Сериализатор для создания объекта модели User."""
 
@@ -257,6 +385,8 @@ class CustomUserCreateSerializer(UserCreateSerializer):
 class RecipeRepresentateForSubcribe(serializers.ModelSerializer):
     """Сериализатор для представления отдельных данных о рецепте."""
 
+    image = RecipeImageField('thumbnail')
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
@@ -281,24 +411,15 @@ class SubscriptionSerializer(serializers.ModelSerializer):
                             'recipes_count')
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return obj.subscribed.filter(user=user).exists()
+        return obj.id in get_user_relations(self.context).subscriptions
 
     def get_recipes(self, obj):
-        recipes_limit = self.context.get('recipes_limit')
-        if recipes_limit is not None:
-            try:
-                recipes_limit = int(recipes_limit)
-                if recipes_limit < 0:
-                    recipes_limit = None
-            except ValueError:
-                recipes_limit = None
-        queryset = obj.recipes.all()[:recipes_limit]
+        queryset = obj.recipes.all()[:self.context.get('recipes_limit')]
         recipes = RecipeRepresentateForSubcribe(queryset, many=True).data
         return recipes
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def validate(self, attrs):
         attrs = super().validate(attrs)
@@ -318,5 +439,6 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context['user']
         author = self.context['author']
-        Subscription.objects.create(user=user, author=author)
+        with transaction.atomic():
+            Subscription.objects.create(user=user, author=author)
         return author
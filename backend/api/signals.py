@@ -0,0 +1,89 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import (BuyList, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, Tag)
+from recipes.signals import (ingredients_loaded, is_batch_delete,
+                             recipe_relations_changed, recipes_imported)
+from users.models import Subscription
+
+from .cache import invalidate
+from .constants import (INGREDIENTS_VERSION_KEY, RECIPE_VERSION_KEY,
+                        RECIPES_VERSION_KEY, TAG_VERSION_KEY, TAGS_VERSION_KEY,
+                        USER_RELATIONS_VERSION_KEY, USER_VERSION_KEY)
+
+User = get_user_model()
+
+
+@receiver(ingredients_loaded)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    """Сбрасывает версию каталога ингредиентов при его изменении."""
+
+    invalidate(INGREDIENTS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    """
+    Изменение рецепта сбрасывает только его версию. Создание и удаление
+    меняют состав страниц списка, поэтому сбрасывают и версию списка.
+    """
+
+    invalidate(RECIPE_VERSION_KEY.format(instance.id))
+    if kwargs.get('created', True):
+        invalidate(RECIPES_VERSION_KEY)
+
+
+@receiver(recipes_imported)
+def invalidate_recipe_list(**kwargs):
+    invalidate(RECIPES_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    invalidate(RECIPE_VERSION_KEY.format(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tag.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Теги определяют попадание рецепта в отфильтрованные страницы."""
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    recipe_ids = (pk_set or ()) if reverse else (instance.id,)
+    for recipe_id in recipe_ids:
+        invalidate(RECIPE_VERSION_KEY.format(recipe_id))
+    invalidate(RECIPES_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    invalidate(TAG_VERSION_KEY.format(instance.id))
+    invalidate(TAGS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_user(sender, instance, update_fields=None, **kwargs):
+    """Вход пользователя обновляет только last_login и не влияет на ответы."""
+
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    invalidate(USER_VERSION_KEY.format(instance.id))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=BuyList)
+@receiver((post_save, post_delete), sender=Subscription)
+def invalidate_user_relations(sender, instance, **kwargs):
+    """Сбрасывает кэш избранного, корзины и подписок пользователя."""
+
+    if is_batch_delete():
+        return
+    invalidate(USER_RELATIONS_VERSION_KEY.format(instance.user_id))
+
+
+@receiver(recipe_relations_changed)
+def invalidate_batch_user_relations(sender, user_id, **kwargs):
+    invalidate(USER_RELATIONS_VERSION_KEY.format(user_id))
@@ -1,18 +1,39 @@
 import base64
 import json
+import os
 import shutil
 import tempfile
-from io import BytesIO
+import timeit
+from io import BytesIO, StringIO
 
+from api.constants import MAX_PAGE_SIZE
+from api.filters import CustomFilterBackend, RecipeFilter
+from api.management.commands.bench_api import SCENARIOS as BENCH_SCENARIOS
+from api.relations import UserRelations
+from api.serializers import (BuyListSerializer, RecipeSerializer,
+                             SubscriptionSerializer)
+from api.utils import get_ingredients_for_download
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import LiveServerTestCase, TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
 from PIL import Image
-from recipes.models import (BuyList, Favorite, Ingredient, IngredientRecipe,
-                            Recipe, Tag)
+from recipes.duplicates import update_fingerprints
+from recipes.models import (BuyList, CartIngredient, Favorite, ImageBlob,
+                            Ingredient, IngredientRecipe, Recipe, Tag)
+from recipes.search import update_search_index
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
 from rest_framework.reverse import reverse
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
+from users.models import Subscription
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -101,10 +122,143 @@ class RecipeTests(TestCase):
         response = self.anon.get(self.url_detail)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_recipe_search(self):
+        """Поиск находит рецепт по названию, тегу и ингредиенту."""
+        for query in ('название', 'т1', 'ингредиент 2'):
+            response = self.anon.get(self.url_list, {'search': query})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([recipe['id'] for recipe in
+                              response.data['results']], [self.recipe.id])
+        response = self.anon.get(self.url_list, {'search': 'пирог'})
+        self.assertEqual(response.data['count'], 0)
+
+    def test_anonymous_responses_are_cached(self):
+        """Повторный запрос анонима отдается из кэша без запросов к БД."""
+        cache.clear()
+        self.anon.get(self.url_list)
+        self.anon.get(self.url_detail)
+        with self.assertNumQueries(0):
+            self.anon.get(self.url_list)
+            self.anon.get(self.url_detail)
+
+    def test_recipe_change_invalidates_cache(self):
+        """Изменение рецепта, его тегов и автора сбрасывает кэш."""
+        cache.clear()
+        self.anon.get(self.url_list)
+        self.anon.get(self.url_detail)
+        recipe = Recipe.objects.get(id=self.recipe.id)
+        recipe.name = 'Другое'
+        recipe.save()
+        response = self.anon.get(self.url_detail)
+        self.assertEqual(response.data['name'], 'Другое')
+        self.recipe.tag.remove(self.tag2)
+        response = self.anon.get(self.url_list)
+        self.assertEqual(len(response.data['results'][0]['tags']), 1)
+        author = User.objects.get(id=self.author.id)
+        author.first_name = 'Автор'
+        author.save()
+        response = self.anon.get(self.url_detail)
+        self.assertEqual(response.data['author']['first_name'], 'Автор')
+
+    def test_conditional_get(self):
+        """Неизмененный рецепт и страница отдаются как 304 без тела."""
+        cache.clear()
+        detail = self.anon.get(self.url_detail)
+        page = self.anon.get(self.url_list)
+        self.assertIn('Last-Modified', detail)
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.anon.get(self.url_detail,
+                                     HTTP_IF_NONE_MATCH=detail['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.anon.get(
+            self.url_detail, HTTP_IF_MODIFIED_SINCE=detail['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.anon.get(self.url_list,
+                                 HTTP_IF_NONE_MATCH=page['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        IngredientRecipe.objects.filter(recipe=self.recipe).first().delete()
+        response = self.anon.get(self.url_detail,
+                                 HTTP_IF_NONE_MATCH=detail['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['ingredients']), 1)
+        response = self.anon.get(self.url_list,
+                                 HTTP_IF_NONE_MATCH=page['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        detail = self.client.get(self.url_detail)
+        self.assertNotIn('Last-Modified', detail)
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+        response = self.client.get(self.url_detail,
+                                   HTTP_IF_NONE_MATCH=detail['ETag'])
+        self.assertTrue(response.data['is_favorited'])
+
+    def test_query_count_headers(self):
+        """Заголовки с запросами к БД включаются только настройкой."""
+        with override_settings(DEBUG=True, QUERY_COUNT_HEADERS=False):
+            self.assertNotIn('X-DB-Queries', self.anon.get(self.url_list))
+        with override_settings(QUERY_COUNT_HEADERS=True):
+            self.assertIn('X-DB-Queries', self.anon.get(self.url_list))
+
+    def test_recipe_modified_follows_content_changes(self):
+        """Время изменения обновляется явно, а не пересборкой индекса."""
+        def get_modified():
+            return Recipe.objects.get(id=self.recipe.id).modified
+
+        modified = get_modified()
+        update_search_index([self.recipe.id])
+        self.assertEqual(get_modified(), modified)
+        self.client.patch(self.url_detail, {'cooking_time': 15},
+                          format='json')
+        self.assertGreater(get_modified(), modified)
+        modified = get_modified()
+        self.tag1.name = 'Новое имя'
+        self.tag1.save()
+        self.assertGreater(get_modified(), modified)
+        modified = get_modified()
+        Recipe.objects.get(id=self.recipe.id).save(update_fields=('text',))
+        self.assertGreater(get_modified(), modified)
+
+    def test_user_flags_applied_to_cached_responses(self):
+        """Флаги пользователя накладываются на общий кэш рецептов."""
+        cache.clear()
+        self.anon.get(self.url_list)
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+        response = self.client.get(self.url_list)
+        recipe = response.data['results'][0]
+        self.assertTrue(recipe['is_favorited'])
+        self.assertFalse(recipe['is_in_shopping_cart'])
+        BuyList.objects.create(user=self.author, recipe=self.recipe)
+        response = self.client.get(self.url_detail)
+        self.assertTrue(response.data['is_in_shopping_cart'])
+        response = self.anon.get(self.url_detail)
+        self.assertFalse(response.data['is_in_shopping_cart'])
+
+    def test_cursor_pagination(self):
+        """Курсорная пагинация проходит рецепты в порядке страниц."""
+        for i in range(4):
+            Recipe.objects.create(author=self.author, name=f'Рецепт {i}',
+                                  text='Описание', cooking_time=10,
+                                  image='recipes/images/test.jpg')
+        response = self.anon.get(self.url_list, {'limit': 20})
+        expected = [recipe['id'] for recipe in response.data['results']]
+        ids = []
+        url, params = self.url_list, {'limit': 2, 'cursor': ''}
+        while url:
+            response = self.anon.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url, params = response.data['next'], None
+        self.assertEqual(ids, expected)
+        response = self.anon.get(self.url_list, {'cursor': 'broken'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_recipe_contains_all_fields(self):
         """Рецепт содержит все необходимые поля указанные в сериализаторе."""
         expected_fields = {'name', 'author', 'id', 'tags', 'ingredients',
-                           'text', 'cooking_time', 'image',
+                           'text', 'cooking_time', 'image', 'images',
                            'is_in_shopping_cart', 'is_favorited'}
         response = self.client.get(self.url_detail)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -129,6 +283,197 @@ class RecipeTests(TestCase):
         self.assertEqual(Recipe.objects.latest('id').name, 'New Recipe')
         self.assertEqual(Recipe.objects.latest('id').author, self.author)
 
+    def test_duplicate_recipe_by_fingerprint(self):
+        """Дубликат - то же название без учета регистра и те же теги."""
+        data = {
+            'name': ' название  РЕЦЕПТА',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': [self.tag2.id, self.tag1.id],
+            'ingredients': [{'id': self.ingredient1.id, 'amount': 10}]
+        }
+        response = self.client.post(self.url_list, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        data['tags'] = [self.tag1.id]
+        response = self.client.post(self.url_list, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.recipe.tag.remove(self.tag2)
+        self.assertEqual(
+            Recipe.objects.filter(
+                fingerprint=Recipe.objects.get(
+                    id=response.data['id']).fingerprint).count(), 2)
+
+    def test_search_index_rebuilt_once_per_change(self):
+        """Создание и правка рецепта пересобирают индекс один раз."""
+        def count_index_updates(method, url, data):
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(
+                    url, data, format='json')
+            self.assertLess(response.status_code, 300, response.data)
+            return response, sum(
+                query['sql'].startswith('UPDATE')
+                and '"search_document"' in query['sql']
+                for query in queries)
+
+        data = {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': [self.tag1.id],
+            'ingredients': [{'id': self.ingredient1.id, 'amount': 10}]
+        }
+        response, updates = count_index_updates('post', self.url_list, data)
+        self.assertEqual(updates, 1)
+        url = reverse('api:recipes-detail', args=[response.data['id']])
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertIn('ингредиент 1', recipe.search_document)
+        response, updates = count_index_updates('patch', url, {
+            'name': 'Другой рецепт', 'tags': [self.tag2.id],
+            'ingredients': [{'id': self.ingredient2.id, 'amount': 5}]})
+        self.assertEqual(updates, 1)
+        recipe.refresh_from_db()
+        self.assertIn('ингредиент 2', recipe.search_document)
+        self.assertIn('т2', recipe.search_document)
+
+    def test_index_queries_do_not_depend_on_size(self):
+        """Индекс и отпечатки пакета пишутся без UPDATE на каждый рецепт."""
+        recipe_ids = []
+        for i in range(20):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'Пакет {i}', text='Описание',
+                cooking_time=10, image='recipes/images/recipe_test.jpg')
+            recipe_ids.append(recipe.id)
+        Recipe.objects.filter(id__in=recipe_ids).update(fingerprint='')
+
+        def measure(ids):
+            with CaptureQueriesContext(connection) as queries:
+                update_search_index(ids)
+                update_fingerprints(ids)
+            return len(queries)
+
+        self.assertEqual(measure(recipe_ids[:2]), measure(recipe_ids[2:]))
+        self.assertFalse(Recipe.objects.filter(fingerprint='').exists())
+        self.assertIn('пакет 5', Recipe.objects.get(
+            id=recipe_ids[5]).search_document)
+
+    @override_settings(IMAGE_WORKERS=0)
+    def test_recipe_image_variants(self):
+        """Фото поворачивается по EXIF и получает уменьшенные копии."""
+        image = Image.new('RGB', (400, 200), color='red')
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', exif=exif)
+        data = {
+            'name': 'Рецепт с фото',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': ('data:image/jpeg;base64,'
+                      + base64.b64encode(buffer.getvalue()).decode()),
+            'tags': [self.tag1.id],
+            'ingredients': [{'id': self.ingredient1.id, 'amount': 10}]
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url_list, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(set(recipe.image_variants),
+                         {'thumbnail', 'card', 'full'})
+        with recipe.image.storage.open(
+                recipe.image_variants['thumbnail']['webp']) as file:
+            self.assertEqual(Image.open(file).size, (120, 240))
+
+        response = self.anon.get(self.url_list)
+        card = next(item for item in response.data['results']
+                    if item['id'] == recipe.id)
+        self.assertEqual(card['image'], card['images']['card']['jpeg'])
+        self.assertTrue(card['images']['thumbnail']['webp'].endswith('.webp'))
+
+    def test_create_recipe_with_multipart(self):
+        """Рецепт создается из формы с файлом, не-изображение отклоняется."""
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10), color='blue').save(buffer, format='PNG')
+        data = {
+            'name': 'Рецепт из формы',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'tags': [self.tag1.id, self.tag2.id],
+            'ingredients': json.dumps(
+                [{'id': self.ingredient2.id, 'amount': 5}]),
+            'image': SimpleUploadedFile('photo.png', buffer.getvalue()),
+        }
+        response = self.client.post(self.url_list, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['tags']), 2)
+        self.assertEqual(response.data['ingredients'][0]['amount'], 5)
+
+        data['image'] = SimpleUploadedFile('photo.png', b'not an image')
+        data['name'] = 'Другой рецепт'
+        response = self.client.post(self.url_list, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('JPEG', str(response.data['image']))
+
+    @override_settings(IMAGE_WORKERS=0)
+    @override_settings(IMAGE_WORKERS=0)
+    def test_recipe_images_are_deduplicated(self):
+        """Одинаковые фото и их копии хранятся до удаления всех ссылок."""
+        data = {
+            'name': 'Первый',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': [self.tag1.id],
+            'ingredients': [{'id': self.ingredient1.id, 'amount': 10}]
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(self.url_list, data, format='json')
+            data['name'] = 'Второй'
+            second = self.client.post(self.url_list, data, format='json')
+        first = Recipe.objects.get(id=first.data['id'])
+        second = Recipe.objects.get(id=second.data['id'])
+        name = first.image.name
+        self.assertEqual(name, second.image.name)
+        self.assertEqual(ImageBlob.objects.get(name=name).refs, 2)
+        self.assertEqual(first.image_variants, second.image_variants)
+        storage = first.image.storage
+        variants = storage.get_variant_names(name)
+        self.assertTrue(all(map(storage.exists, variants)))
+
+        url = reverse('api:recipes-detail', kwargs={'pk': first.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, data, format='json')
+            self.client.delete(url)
+        self.assertTrue(first.image.storage.exists(name))
+        self.assertTrue(all(map(storage.exists, variants)))
+        self.assertEqual(ImageBlob.objects.get(name=name).refs, 1)
+        url = reverse('api:recipes-detail', kwargs={'pk': second.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(url)
+        self.assertFalse(first.image.storage.exists(name))
+        self.assertFalse(any(map(storage.exists, variants)))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+
+    def test_collect_orphan_images(self):
+        """Файл из откатившейся транзакции удаляется, живые остаются."""
+        storage = self.recipe.image.storage
+        kept = storage.save('recipes/images/kept.gif', ContentFile(b'kept'))
+        with transaction.atomic():
+            orphan = storage.save('recipes/images/orphan.gif',
+                                  ContentFile(b'orphan'))
+            transaction.set_rollback(True)
+        self.assertTrue(storage.exists(orphan))
+        self.assertFalse(ImageBlob.objects.filter(name=orphan).exists())
+
+        call_command('collect_orphan_images', stdout=StringIO())
+        self.assertTrue(storage.exists(orphan))
+        call_command('collect_orphan_images', '--min-age', '0',
+                     stdout=StringIO())
+        self.assertFalse(storage.exists(orphan))
+        self.assertFalse(ImageBlob.objects.filter(name=orphan).exists())
+        self.assertTrue(storage.exists(kept))
+
     def test_authenticated_user_can_delete_own_recipe(self):
         """Авторизованный пользователь может удалить свой рецепт."""
         recipes_count = Recipe.objects.count()
@@ -145,6 +490,31 @@ class RecipeTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(Recipe.objects.get(id=self.recipe.id).name, 'Patchme')
 
+    def test_patch_updates_only_changed_ingredients(self):
+        """PATCH пишет только измененные строки и не трогает теги."""
+        rows = dict(IngredientRecipe.objects.filter(
+            recipe=self.recipe).values_list('ingredient_id', 'id'))
+        data = {'ingredients': [
+            {'id': self.ingredient1.id, 'amount': 150},
+            {'id': self.ingredient2.id, 'amount': 200},
+        ]}
+        response = self.client.patch(self.url_detail, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(dict(IngredientRecipe.objects.filter(
+            recipe=self.recipe).values_list('ingredient_id', 'id')), rows)
+        self.assertEqual(IngredientRecipe.objects.get(
+            id=rows[self.ingredient1.id]).amount, 150)
+        self.assertEqual(self.recipe.tag.count(), 2)
+
+        data = {'ingredients': [{'id': self.ingredient2.id, 'amount': 5}]}
+        self.client.patch(self.url_detail, data, format='json')
+        self.assertEqual(list(IngredientRecipe.objects.filter(
+            recipe=self.recipe).values_list('id', 'amount')),
+            [(rows[self.ingredient2.id], 5)])
+        response = self.client.patch(self.url_detail, {'tags': []},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_authenticated_user_can_add_recipe_to_favorite(self):
         """Авторизованный пользователь может добавить рецепт в избранное."""
         response = self.client.post(self.favorite_recipe_url)
@@ -153,6 +523,34 @@ class RecipeTests(TestCase):
         self.assertEqual(self.author.favorite_set.first().recipe,
                          self.recipe)
 
+    def test_favorite_and_cart_counters(self):
+        """Счетчики рецепта и автора обновляются и проходят проверку."""
+        self.client.post(self.favorite_recipe_url)
+        self.client.post(self.buy_recipe_url)
+        recipe = Recipe.objects.get(id=self.recipe.id)
+        self.assertEqual((recipe.favorites_count, recipe.carts_count), (1, 1))
+        self.assertEqual(User.objects.get(id=self.author.id).recipes_count, 1)
+        self.client.delete(self.favorite_recipe_url)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+
+    def test_ordering_by_favorites_count_not_cached(self):
+        """Сортировка по счетчику видит его изменения сразу."""
+        cache.clear()
+        recipe = Recipe.objects.create(
+            author=self.author, name='Второй рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/recipe_test.jpg')
+        params = {'ordering': '-favorites_count,-pub_date'}
+        page = self.anon.get(self.url_list, params)
+        self.assertEqual(page.data['results'][0]['id'], recipe.id)
+        self.client.post(self.favorite_recipe_url)
+        response = self.anon.get(self.url_list, params)
+        self.assertEqual(response.data['results'][0]['id'], self.recipe.id)
+        response = self.anon.get(self.url_list, params,
+                                 HTTP_IF_NONE_MATCH=page['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_authenticated_user_can_remove_recipe_from_favorite(self):
         """Авторизованный пользователь может удалить рецепт из избранного."""
         Favorite.objects.create(user=self.author, recipe=self.recipe)
@@ -175,6 +573,201 @@ class RecipeTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(self.author.buylist_set.count(), 0)
 
+    def test_download_shopping_cart(self):
+        """Список покупок выгружается в txt, csv и json и помечается ETag."""
+        url = reverse('api:download_shopping_cart')
+        BuyList.objects.create(user=self.author, recipe=self.recipe)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Ингредиент 1 (г) — 100', content)
+        response = self.client.get(url, {'format': 'csv'})
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Ингредиент 2,мл,200', content)
+        response = self.client.get(url, {'format': 'json'})
+        content = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(content), 2)
+
+        etag = response['ETag']
+        # Единственный запрос - проверка токена.
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'format': 'json'},
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        IngredientRecipe.objects.filter(recipe=self.recipe).first().save()
+        response = self.client.get(url, {'format': 'json'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_batch_shopping_cart(self):
+        """Пакетное добавление и удаление поддерживает счетчики и корзину."""
+        url = reverse('api:shopping_cart_batch')
+        response = self.client.post(
+            url, {'recipes': [self.recipe.id, 999999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'id': self.recipe.id, 'status': 'added'},
+            {'id': 999999, 'status': 'not_found'}])
+        response = self.client.post(
+            url, {'recipes': [self.recipe.id]}, format='json')
+        self.assertEqual(response.data['results'][0]['status'], 'exists')
+        self.assertEqual(Recipe.objects.get(id=self.recipe.id).carts_count, 1)
+        self.assertTrue(
+            self.client.get(self.url_detail).data['is_in_shopping_cart'])
+        call_command('check_cart', stdout=StringIO())
+
+        response = self.client.delete(
+            url, {'recipes': [self.recipe.id]}, format='json')
+        self.assertEqual(response.data['results'][0]['status'], 'removed')
+        self.assertFalse(
+            self.client.get(self.url_detail).data['is_in_shopping_cart'])
+        self.assertFalse(CartIngredient.objects.exists())
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+        response = self.client.post(url, {'recipes': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_single_add_rechecks_under_lock(self):
+        """Рецепт, добавленный пакетом после validate, не считается дважды."""
+        request = self.client.get(self.url_detail).wsgi_request
+        request.user = self.author
+        serializer = BuyListSerializer(context={
+            'request': request, 'recipe_id': self.recipe.id})
+        self.client.post(reverse('api:shopping_cart_batch'),
+                         {'recipes': [self.recipe.id]}, format='json')
+        with self.assertRaises(ValidationError):
+            serializer.create({})
+        self.assertEqual(Recipe.objects.get(id=self.recipe.id).carts_count, 1)
+        call_command('check_cart', stdout=StringIO())
+
+    def test_batch_queries_do_not_depend_on_size(self):
+        """Число запросов пакета не зависит от числа рецептов в нем."""
+        url = reverse('api:shopping_cart_batch')
+        recipe_ids = []
+        for i in range(20):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'Пакет {i}', text='Описание',
+                cooking_time=10, image='recipes/images/recipe_test.jpg')
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=self.ingredient1, amount=10)
+            recipe_ids.append(recipe.id)
+
+        def measure(method, ids):
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(
+                    url, {'recipes': ids}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        for method in ('post', 'delete'):
+            with self.subTest(method=method):
+                self.assertEqual(measure(method, recipe_ids[:2]),
+                                 measure(method, recipe_ids[2:]))
+        self.assertFalse(CartIngredient.objects.exists())
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+
+    def test_import_recipes(self):
+        """Импорт создает рецепты пакетами и пропускает уже загруженные."""
+        path = os.path.join(TEMP_MEDIA_ROOT, 'recipes.jsonl')
+        record = {
+            'author': self.author.username,
+            'text': 'Описание',
+            'cooking_time': 20,
+            'tags': [self.tag1.slug],
+            'ingredients': [
+                {'name': 'Ингредиент 1', 'measurement_unit': 'г',
+                 'amount': 10},
+                {'id': self.ingredient2.id, 'amount': 20}],
+            'image': self.image,
+        }
+        with open(path, 'w', encoding='utf-8') as file:
+            for name in ('Импорт 1', 'Импорт 2'):
+                file.write(json.dumps({**record, 'name': name}) + '\n')
+            file.write(json.dumps({**record, 'name': 'Импорт 3',
+                                   'tags': ['unknown']}) + '\n')
+        call_command('import_recipes', path, '--batch-size', '2',
+                     stdout=StringIO(), stderr=StringIO())
+        imported = Recipe.objects.filter(name__startswith='Импорт')
+        self.assertEqual(imported.count(), 2)
+        recipe = imported.first()
+        self.assertEqual(recipe.recipe_ingredients.count(), 2)
+        self.assertEqual(list(recipe.tag.all()), [self.tag1])
+        self.assertIn('ингредиент 2', recipe.search_document)
+        self.assertEqual(ImageBlob.objects.get(name=recipe.image.name).refs, 2)
+        self.assertEqual(User.objects.get(id=self.author.id).recipes_count, 3)
+        self.assertFalse(os.path.exists(path + '.progress'))
+
+        call_command('import_recipes', path, stdout=StringIO(),
+                     stderr=StringIO())
+        self.assertEqual(imported.count(), 2)
+
+    def test_seed_synthetic(self):
+        """Синтетические данные повторяются при том же seed."""
+        out = StringIO()
+
+        def seed(prefix):
+            call_command('seed_synthetic', '--users', '5', '--recipes', '7',
+                         '--favorites', '10', '--carts', '5',
+                         '--subscriptions', '5', '--images', '2',
+                         '--batch-size', '3', '--workers', '1',
+                         '--prefix', prefix, stdout=out)
+            return list(Recipe.objects.filter(
+                author__username__startswith=prefix
+            ).order_by('id').values_list('name', 'cooking_time'))
+
+        count = self.client.get(self.url_list).data['count']
+        first = seed('first')
+        self.assertEqual(len(first), 7)
+        self.assertEqual(self.client.get(self.url_list).data['count'],
+                         count + 7)
+        self.assertEqual(seed('second'), first)
+        self.assertTrue(Favorite.objects.filter(
+            user__username__startswith='first').exists())
+        progress = out.getvalue().splitlines()
+        for model in (Favorite, BuyList, Subscription):
+            title = f'{model._meta.verbose_name_plural}:'
+            done = [line for line in progress if line.startswith(title)]
+            self.assertEqual(int(done[-1].split()[1]), model.objects.filter(
+                user__username__startswith='second').count())
+        images = ImageBlob.objects.filter(name__in=Recipe.objects.filter(
+            author__username__startswith='first'
+        ).values('image'))
+        self.assertLessEqual(images.count(), 2)
+        self.assertEqual(sum(images.values_list('refs', flat=True)), 14)
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+        call_command('check_cart', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            seed('first')
+
+    def test_cart_ingredients_follow_changes(self):
+        """Суммы в корзине обновляются при изменении корзины и рецепта."""
+        def get_cart():
+            return dict(CartIngredient.objects.filter(
+                user=self.author).values_list('ingredient_id', 'amount'))
+
+        self.client.post(self.buy_recipe_url)
+        self.assertEqual(get_cart(), {self.ingredient1.id: 100,
+                                      self.ingredient2.id: 200})
+        data = self.client.get(self.url_detail).data
+        data['tags'] = [tag['id'] for tag in data['tags']]
+        data['image'] = self.image
+        data['ingredients'] = [{'id': self.ingredient1.id, 'amount': 30}]
+        self.client.patch(self.url_detail, data, format='json')
+        self.assertEqual(get_cart(), {self.ingredient1.id: 30})
+        ingredient = IngredientRecipe.objects.get(recipe=self.recipe)
+        ingredient.amount = 50
+        ingredient.save()
+        self.assertEqual(get_cart(), {self.ingredient1.id: 50})
+        call_command('check_cart', stdout=StringIO())
+
+        self.client.delete(self.url_detail)
+        self.assertEqual(get_cart(), {})
+        CartIngredient.objects.create(
+            user=self.author, ingredient=self.ingredient2, amount=1)
+        with self.assertRaises(CommandError):
+            call_command('check_cart', stdout=StringIO())
+        call_command('check_cart', '--fix', stdout=StringIO())
+        self.assertEqual(get_cart(), {})
+
     def test_anonymous_user_cannot_add_recipe_to_favorite(self):
         """Аноним не может добавить рецепт в избранное."""
         response = self.anon.post(self.favorite_recipe_url)
@@ -265,6 +858,44 @@ class UserRegistrationTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(self.user2.subscribed.count(), 1)
         self.assertEqual(expected_fields, set(response.data.keys()))
+        self.assertEqual(
+            User.objects.get(id=self.user2.id).followers_count, 1)
+
+    def test_users_list_resolves_subscriptions_once(self):
+        """Число запросов к БД для списка не зависит от числа авторов."""
+        url = reverse('api:user-list')
+        self.client.post(reverse('api:subscribe',
+                                 kwargs={'author_id': self.user2.id}))
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        flags = {user['id']: user['is_subscribed']
+                 for user in response.data['results']}
+        self.assertEqual(flags, {self.user1.id: False, self.user2.id: True})
+        for i in range(3):
+            User.objects.create_user(username=f'extra{i}',
+                                     email=f'extra{i}@example.com')
+        cache.clear()
+        with self.assertNumQueries(len(queries)):
+            self.client.get(url)
+
+    def test_subscriptions_recipes_limit(self):
+        """На странице подписок выводится не больше recipes_limit рецептов."""
+        for i in range(3):
+            Recipe.objects.create(author=self.user2, name=f'Рецепт {i}',
+                                  text='Описание', cooking_time=10,
+                                  image='recipes/images/test.jpg')
+        Subscription.objects.create(user=self.user1, author=self.user2)
+        url = reverse('api:user-subscriptions')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'recipes_limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        author = response.data['results'][0]
+        self.assertEqual([recipe['name'] for recipe in author['recipes']],
+                         ['Рецепт 2', 'Рецепт 1'])
+        self.assertEqual(author['recipes_count'], 3)
+        self.assertTrue(any('ROW_NUMBER' in query['sql']
+                            for query in queries.captured_queries))
 
     def test_anon_cant_subscribe(self):
         """Анонимный пользователь не может оформлять подписки."""
@@ -327,3 +958,403 @@ class UserRegistrationTest(TestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code,
                          status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class IngredientSearchTests(TestCase):
+    """Тесты поиска ингредиентов по началу имени."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ('Соль морская', 'соль', 'Солод', 'Сахар'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        cls.url = reverse('api:ingredients-list')
+
+    def setUp(self):
+        cache.clear()
+        self.anon = APIClient()
+
+    def test_search_is_case_insensitive_and_ranked(self):
+        """Точное совпадение первым, затем более короткие имена."""
+        response = self.anon.get(self.url, {'name': 'СОЛ'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data],
+                         ['соль', 'Солод', 'Соль морская'])
+        response = self.anon.get(self.url, {'name': 'соль'})
+        self.assertEqual([item['name'] for item in response.data],
+                         ['соль', 'Соль морская'])
+
+    def test_load_ingredients_is_idempotent(self):
+        """Загрузка JSON и CSV пакетами, повторная ничего не меняет."""
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        json_path = os.path.join(directory, 'ingredients.json')
+        csv_path = os.path.join(directory, 'ingredients.csv')
+        with open(json_path, 'w', encoding='utf-8') as file:
+            json.dump([{'name': 'соль', 'measurement_unit': 'г'},
+                       {'name': 'мука', 'measurement_unit': 'г'},
+                       {'name': 'мука', 'measurement_unit': 'г'},
+                       {'name': 'Молоко', 'measurement_unit': 'мл'}], file)
+        with open(csv_path, 'w', encoding='utf-8') as file:
+            file.write('мука,г\nсахар,г\n')
+
+        out = StringIO()
+        call_command('parse_json', json_path, '--batch-size', '2',
+                     stdout=out)
+        self.assertIn('Добавлено: 2, обновлено: 0, пропущено: 2',
+                      out.getvalue())
+        self.assertEqual(self.anon.get(self.url, {'name': 'мук'}).data[0][
+            'name'], 'мука')
+        out = StringIO()
+        call_command('parse_json', json_path, stdout=out)
+        self.assertIn('Добавлено: 0, обновлено: 0, пропущено: 4',
+                      out.getvalue())
+        out = StringIO()
+        call_command('parse_json', csv_path, '--on-conflict', 'update',
+                     stdout=out)
+        self.assertIn('Добавлено: 0, обновлено: 1, пропущено: 1',
+                      out.getvalue())
+        self.assertTrue(Ingredient.objects.filter(name='сахар').exists())
+        self.assertFalse(Ingredient.objects.filter(name='Сахар').exists())
+
+    def test_prerendered_catalogs(self):
+        """Справочники отдаются из памяти с ETag до их изменения."""
+        for url in (self.url, reverse('api:tags-list')):
+            self.anon.get(url)
+            with self.assertNumQueries(0):
+                response = self.anon.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            etag = response['ETag']
+            with self.assertNumQueries(0):
+                response = self.anon.get(url, HTTP_ACCEPT_ENCODING='gzip',
+                                         HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code,
+                             status.HTTP_304_NOT_MODIFIED)
+
+        response = self.anon.get(self.url)
+        self.assertEqual(len(json.loads(response.content)), 4)
+        Ingredient.objects.create(name='Перец', measurement_unit='г')
+        response = self.anon.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(response.content)), 5)
+
+    def test_search_limit(self):
+        """Параметр limit ограничивает количество результатов."""
+        response = self.anon.get(self.url, {'name': 'с', 'limit': 2})
+        self.assertEqual(len(response.data), 2)
+
+    def test_fuzzy_search_ranks_prefix_first(self):
+        """Нечеткий поиск находит имена с опечатками после префиксных."""
+        response = self.anon.get(self.url, {'name': 'сахр'})
+        self.assertEqual(response.data, [])
+        response = self.anon.get(self.url, {'name': 'сахр', 'fuzzy': 1})
+        self.assertEqual([item['name'] for item in response.data], ['Сахар'])
+        Ingredient.objects.create(name='Сахарная пудра', measurement_unit='г')
+        response = self.anon.get(self.url, {'name': 'сахар', 'fuzzy': 1})
+        self.assertEqual([item['name'] for item in response.data],
+                         ['Сахар', 'Сахарная пудра'])
+        response = self.anon.get(self.url, {'name': 'сохар', 'fuzzy': 1})
+        self.assertEqual(response.data[0]['name'], 'Сахар')
+
+    def test_search_sees_new_ingredients(self):
+        """Индекс пересобирается после изменения каталога."""
+        self.anon.get(self.url, {'name': 'сол'})
+        Ingredient.objects.create(name='Солянка', measurement_unit='г')
+        response = self.anon.get(self.url, {'name': 'солян'})
+        self.assertEqual([item['name'] for item in response.data],
+                         ['Солянка'])
+
+
+# Бюджеты запросов горячих маршрутов: маршрут, аргументы маршрута
+# по набору данных, параметры запроса, наибольшее число запросов к БД
+# и наибольшее суммарное время запросов в секундах.
+QUERY_BUDGETS = (
+    ('api:recipes-list', None, {'limit': 20}, 8, 0.5),
+    ('api:recipes-list', None, {'limit': 20, 'is_favorited': 1}, 8, 0.5),
+    ('api:recipes-detail', lambda data: {'pk': data.recipes[-1].id}, {},
+     7, 0.5),
+    ('api:user-subscriptions', None, {'limit': 20, 'recipes_limit': 3},
+     6, 0.5),
+    ('api:user-list', None, {'limit': 20}, 5, 0.5),
+    ('api:download_shopping_cart', None, {}, 4, 0.5),
+    ('api:tags-list', None, {}, 1, 0.5),
+    ('api:ingredients-list', None, {}, 1, 0.5),
+)
+# Размеры наборов данных: число авторов, рецептов и ингредиентов рецепта.
+# Последний больше страницы с наибольшим limit, чтобы N+1 по строкам
+# страницы отличался от роста общего числа рецептов.
+DATASET_SIZES = (2, 10, MAX_PAGE_SIZE + 10)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class QueryBudgetTests(TestCase):
+    """
+    Маршруты из QUERY_BUDGETS вызываются с пустым кэшем на наборах
+    данных растущего размера. Число запросов не должно расти вместе
+    с данными (N+1) и превышать бюджет, время запросов - тоже.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password1')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'budget-{i}')
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Продукт {i}',
+                                      measurement_unit='г')
+            for i in range(max(DATASET_SIZES))
+        ]
+        cls.recipes = []
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _grow_dataset(self, size):
+        """Добавляет авторов с рецептами, подписки, избранное и корзину."""
+
+        for i in range(len(self.recipes), size):
+            author = User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='password1')
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', text='Описание',
+                cooking_time=10, image='recipes/images/budget.jpg')
+            recipe.tag.set(self.tags)
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=10)
+                for ingredient in self.ingredients[:size])
+            Subscription.objects.create(user=self.user, author=author)
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            BuyList.objects.create(user=self.user, recipe=recipe)
+            self.recipes.append(recipe)
+
+    def _measure(self, route, kwargs, params):
+        cache.clear()
+        url = reverse(route, kwargs=kwargs(self) if kwargs else None)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+            if response.streaming:
+                # Потоковый ответ читает данные из БД при отдаче тела.
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        return (len(queries),
+                sum(float(query['time']) for query in queries))
+
+    def test_query_budgets(self):
+        counts = {}
+        for size in DATASET_SIZES:
+            self._grow_dataset(size)
+            for budget in QUERY_BUDGETS:
+                route, kwargs, params, max_queries, max_time = budget
+                with self.subTest(route=route, params=params, size=size):
+                    count, time = self._measure(route, kwargs, params)
+                    counts.setdefault((route, str(params)), []).append(count)
+                    self.assertLessEqual(count, max_queries)
+                    self.assertLessEqual(time, max_time)
+        for (route, params), route_counts in counts.items():
+            with self.subTest(route=route, params=params):
+                self.assertEqual(len(set(route_counts)), 1,
+                                 'Число запросов растет с размером данных: '
+                                 f'{route_counts}')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, QUERY_COUNT_HEADERS=True,
+                   IMAGE_WORKERS=0)
+class BenchApiTests(LiveServerTestCase):
+    """Команда bench_api на живом сервере тестов."""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10), color='red').save(buffer, format='JPEG')
+        image = default_storage.save('recipes/images/bench.jpg',
+                                     ContentFile(buffer.getvalue()))
+        self.user = User.objects.create_user(
+            username='bench', email='bench@example.com', password='bench-pass')
+        tag = Tag.objects.create(name='Завтрак', color='#FFAA00',
+                                 slug='breakfast')
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author=self.user, name='Омлет', text='Описание', cooking_time=5,
+            image=image)
+        recipe.tag.add(tag)
+        IngredientRecipe.objects.create(recipe=recipe, ingredient=ingredient,
+                                        amount=5)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_bench_api(self):
+        output = os.path.join(self.output_dir, 'bench.json')
+        call_command('bench_api', '--base-url', self.live_server_url,
+                     '--email', 'bench@example.com',
+                     '--password', 'bench-pass', '--requests', '4',
+                     '--concurrency', '1', '--output', output,
+                     stdout=StringIO())
+        with open(output, encoding='utf-8') as file:
+            report = json.load(file)
+        self.assertEqual(set(report['scenarios']),
+                         set(BENCH_SCENARIOS))
+        self.assertEqual(
+            [name for name, result in report['scenarios'].items()
+             if result['errors']], [])
+        self.assertEqual(
+            report['scenarios']['favorite_toggle']['requests'], 8)
+        detail = report['scenarios']['recipe_detail']
+        self.assertLessEqual(detail['p50_ms'], detail['p99_ms'])
+        self.assertIsNotNone(detail['db_queries'])
+        with self.assertRaises(CommandError):
+            call_command('bench_api', '--base-url', self.live_server_url,
+                         '--scenarios', 'unknown', stdout=StringIO())
+
+
+# Размеры входных данных микробенчмарков и число повторов замера.
+BENCHMARK_SIZES = (10, 100, 1000)
+BENCHMARK_REPEATS = 3
+
+
+@tag('benchmark')
+class HotPathBenchmarks(TestCase):
+    """
+    Микробенчмарки сериализаторов и фильтров на данных в памяти:
+    связанные объекты подставляются в кэш prefetch_related, поэтому
+    замеры не обращаются к БД. Лучшее время каждого замера сравнивается
+    с базовым из settings.BENCHMARK_BASELINE, замедление больше
+    settings.BENCHMARK_THRESHOLD считается регрессией.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.results = {}
+        try:
+            with open(settings.BENCHMARK_BASELINE, encoding='utf-8') as file:
+                cls.baseline = json.load(file)
+        except FileNotFoundError:
+            cls.baseline = {}
+        cls.factory = APIRequestFactory()
+        cls.tags = [Tag(id=i, name=f'Тег {i}', color='#FFAA00',
+                        slug=f'tag-{i}') for i in range(1, 4)]
+        cls.ingredients = [Ingredient(id=i, name=f'Продукт {i}',
+                                      measurement_unit='г')
+                           for i in range(1, 9)]
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.results and (settings.BENCHMARK_UPDATE or not cls.baseline):
+            with open(settings.BENCHMARK_BASELINE, 'w',
+                      encoding='utf-8') as file:
+                json.dump({**cls.baseline, **cls.results}, file, indent=2,
+                          sort_keys=True)
+        super().tearDownClass()
+
+    def _benchmark(self, name, build, sizes=BENCHMARK_SIZES):
+        """build(size) готовит данные и возвращает измеряемую функцию."""
+
+        threshold = settings.BENCHMARK_THRESHOLD
+        for size in sizes:
+            key = f'{name}[{size}]'
+            timer = timeit.Timer(build(size))
+            with self.assertNumQueries(0):
+                number, _ = timer.autorange()
+                seconds = min(timer.repeat(BENCHMARK_REPEATS, number)) / number
+            self.results[key] = seconds
+            baseline = self.baseline.get(key)
+            with self.subTest(benchmark=key):
+                if baseline is not None:
+                    self.assertLessEqual(
+                        seconds, baseline * (1 + threshold),
+                        f'{key}: {seconds * 1e6:.1f} мкс, базовое время '
+                        f'{baseline * 1e6:.1f} мкс.')
+
+    def _make_author(self, i, recipes=()):
+        author = User(id=i, username=f'author{i}',
+                      email=f'author{i}@example.com',
+                      first_name='Автор', last_name=str(i))
+        author.recipes_count = len(recipes)
+        author._prefetched_objects_cache = {'recipes': list(recipes)}
+        return author
+
+    def _make_recipe(self, i, author=None):
+        recipe = Recipe(id=i, author=author or self._make_author(i),
+                        name=f'Рецепт {i}', text='Описание',
+                        cooking_time=10, image='recipes/images/bench.jpg')
+        recipe._prefetched_objects_cache = {
+            'tag': list(self.tags),
+            'recipe_ingredients': [
+                IngredientRecipe(id=i * 10 + position, recipe=recipe,
+                                 ingredient=ingredient, amount=position + 1)
+                for position, ingredient in enumerate(self.ingredients)
+            ],
+        }
+        return recipe
+
+    def test_recipe_serializer(self):
+        def build(size):
+            recipes = [self._make_recipe(i) for i in range(1, size + 1)]
+            return lambda: RecipeSerializer(recipes, many=True, context={
+                'user_relations': UserRelations(),
+                'image_variant': 'card'}).data
+
+        self._benchmark('recipe_serializer', build)
+
+    def test_subscription_serializer(self):
+        def build(size):
+            authors = [self._make_author(i, [
+                self._make_recipe(i * 10 + number) for number in range(5)])
+                for i in range(1, size + 1)]
+            return lambda: SubscriptionSerializer(authors, many=True, context={
+                'user_relations': UserRelations(),
+                'recipes_limit': 3}).data
+
+        self._benchmark('subscription_serializer', build)
+
+    def test_recipe_filter_tags(self):
+        def build(size):
+            request = self.factory.get('/api/recipes/', {
+                'tags': [f'tag-{i}' for i in range(size)]})
+            return lambda: str(RecipeFilter(
+                request.GET, Recipe.objects.all(), request=request).qs.query)
+
+        self._benchmark('recipe_filter_tags', build)
+
+    def test_custom_filter_backend(self):
+        def build(size):
+            # Работа фильтра не зависит от размера данных: размер задает
+            # число уже примененных к queryset фильтров по тегам.
+            request = Request(self.factory.get(
+                '/api/recipes/',
+                {'is_favorited': '1', 'is_in_shopping_cart': '1'}))
+            request.user = self._make_author(1)
+            queryset = Recipe.objects.filter(
+                tag__slug__in=[f'tag-{i}' for i in range(size)])
+            backend = CustomFilterBackend()
+            return lambda: str(backend.filter_queryset(
+                request, queryset, None).query)
+
+        self._benchmark('custom_filter_backend', build)
+
+    def test_ingredients_for_download(self):
+        def build(size):
+            ingredients = [{'ingredient__name': f'Продукт {i}',
+                            'ingredient__measurement_unit': 'г',
+                            'amount': i} for i in range(size)]
+            return lambda: get_ingredients_for_download(ingredients)
+
+        self._benchmark('ingredients_for_download', build)
@@ -2,9 +2,10 @@ from django.urls import include, path
 from djoser.views import UserViewSet
 from rest_framework.routers import DefaultRouter
 
-from .views import (BuyListViewSet, CustomUserViewSet, DownloadShoppingCart,
-                    FavoriteViewSet, IngredientViewSet, RecipeViewSet,
-                    SubscriptionViewSet, TagViewSet)
+from .views import (BuyListBatchView, BuyListViewSet, CustomUserViewSet,
+                    DownloadShoppingCart, FavoriteBatchView, FavoriteViewSet,
+                    IngredientViewSet, RecipeViewSet, SubscriptionViewSet,
+                    TagViewSet)
 
 app_name = 'recipes'
 
@@ -22,6 +23,10 @@ urlpatterns = [
     path('recipes/<int:recipe_id>/shopping_cart/',
          BuyListViewSet.as_view({'post': 'create', 'delete': 'destroy'}),
          name='shopping_cart'),
+    path('recipes/favorite/', FavoriteBatchView.as_view(),
+         name='favorite_batch'),
+    path('recipes/shopping_cart/', BuyListBatchView.as_view(),
+         name='shopping_cart_batch'),
     path('recipes/download_shopping_cart/', DownloadShoppingCart.as_view(),
          name='download_shopping_cart'),
     path('users/subscriptions/', SubscriptionViewSet.as_view({'get': 'list'}),
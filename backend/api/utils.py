@@ -1,6 +1,67 @@
+import csv
+import hashlib
+import io
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Tuple
+
 from django.db.models import QuerySet
+from django.utils.cache import quote_etag
 from recipes.models import IngredientRecipe
 
+from .cache import get_version, get_versions
+from .constants import (INGREDIENTS_VERSION_KEY, RECIPE_VERSION_KEY,
+                        USER_RELATIONS_VERSION_KEY)
+from .relations import UserRelations
+
+
+def iter_ingredients_txt(queryset: Iterable[Dict]) -> Iterator[str]:
+    """Построчно формирует список покупок в виде текста."""
+
+    yield 'Список покупок:'
+    for ingredient in queryset:
+        yield (f'\n{ingredient["ingredient__name"]} '
+               f'({ingredient["ingredient__measurement_unit"]})'
+               f' — {ingredient["amount"]}')
+
+
+def iter_ingredients_csv(queryset: Iterable[Dict]) -> Iterator[str]:
+    """Построчно формирует список покупок в формате CSV."""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in queryset:
+        writer.writerow((ingredient['ingredient__name'],
+                         ingredient['ingredient__measurement_unit'],
+                         ingredient['amount']))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ingredients_json(queryset: Iterable[Dict]) -> Iterator[str]:
+    """Поэлементно формирует список покупок в виде JSON-массива."""
+
+    separator = ''
+    yield '['
+    for ingredient in queryset:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        }, ensure_ascii=False)
+        separator = ', '
+    yield ']'
+
+
+SHOPPING_LIST_WRITERS = {
+    'txt': iter_ingredients_txt,
+    'csv': iter_ingredients_csv,
+    'json': iter_ingredients_json,
+}
+
 
 def get_ingredients_for_download(queryset: QuerySet[IngredientRecipe]) -> str:
     """
@@ -9,11 +70,44 @@ def get_ingredients_for_download(queryset: QuerySet[IngredientRecipe]) -> str:
     полученных данных в виде списка объекта.
     """
 
-    ingredient_list: list = ['Список покупок:', ]
-    for ingredient in queryset:
-        line = (f'{ingredient["ingredient__name"]} '
-                f'({ingredient["ingredient__measurement_unit"]})'
-                f' — {ingredient["amount"]}')
-        ingredient_list.append(line)
-    response_content = '\n'.join(ingredient_list)
-    return response_content
+    return ''.join(iter_ingredients_txt(queryset))
+
+
+def get_shopping_cart_etag(user, file_format: str) -> str:
+    """
+    ETag списка покупок по версиям корзины пользователя, рецептов в ней
+    и каталога ингредиентов. Вычисляется без агрегации по БД.
+    """
+
+    recipe_keys = sorted(RECIPE_VERSION_KEY.format(recipe_id)
+                         for recipe_id in UserRelations(user).cart)
+    versions = get_versions(recipe_keys)
+    parts = [
+        file_format,
+        get_version(USER_RELATIONS_VERSION_KEY.format(user.id)),
+        get_version(INGREDIENTS_VERSION_KEY),
+        *(versions[key] for key in recipe_keys),
+    ]
+    digest = hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def get_recipes_etag(user, recipes: Iterable[Tuple[int, datetime]],
+                     *parts) -> str:
+    """
+    ETag рецептов по их id и наибольшему времени изменения: любое
+    изменение рецепта делает его время самым поздним. Для пользователя
+    учитывается версия его связей, от которой зависят флаги в ответе.
+    """
+
+    recipes = list(recipes)
+    parts = [
+        *parts,
+        ','.join(str(recipe_id) for recipe_id, _ in recipes),
+        max((modified for _, modified in recipes), default=''),
+    ]
+    if user.is_authenticated:
+        parts += [user.id, get_version(
+            USER_RELATIONS_VERSION_KEY.format(user.id))]
+    digest = hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    return quote_etag(digest)
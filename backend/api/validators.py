@@ -1,6 +1,7 @@
 from typing import List, Type, Union
 
 from django.db import models
+from recipes.constants import MAX_IMAGE_PIXELS, MAX_IMAGE_SIZE
 from rest_framework import serializers
 
 
@@ -21,3 +22,16 @@ def validate_number(name: str, num: int, max: int, min: int) -> None:
         raise serializers.ValidationError(
             f'Поле {name} содержит не числовое или слишком большое '
             f'значение {num}.')
+
+
+def validate_image_size(image) -> None:
+    """Проверяет размер файла и число пикселей загруженного изображения."""
+
+    if image.size > MAX_IMAGE_SIZE:
+        raise serializers.ValidationError(
+            f'Размер изображения больше {MAX_IMAGE_SIZE // 1024 // 1024} МБ.')
+    pil_image = getattr(image, 'image', None)
+    if pil_image is not None and (
+            pil_image.width * pil_image.height > MAX_IMAGE_PIXELS):
+        raise serializers.ValidationError(
+            'Слишком большое разрешение изображения.')
@@ -1,73 +1,267 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Exists, OuterRef, Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (BuyList, Favorite, Ingredient, IngredientRecipe,
+from recipes.batch import add_recipes, lock_user, remove_recipes
+from recipes.models import (BuyList, CartIngredient, Favorite, Ingredient,
                             Recipe, Tag)
 from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.filters import OrderingFilter
 from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import FormParser, JSONParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from users.models import Subscription
 
-from .filters import CustomFilterBackend, IngredientsSearch, RecipeFilter
+from .cache import (get_cached_response, get_recipe_dependencies,
+                    get_response_cache_key, set_cached_response)
+from .catalog import ingredients_catalog, tags_catalog
+from .constants import (CACHEABLE_RECIPE_PARAMS, CONDITIONAL_HEADERS,
+                        INGREDIENT_SEARCH_LIMIT, MAX_INGREDIENT_SEARCH_LIMIT,
+                        RECIPES_VERSION_KEY, UNCACHEABLE_ORDERING_FIELDS)
+from .filters import CustomFilterBackend, RecipeFilter, RecipeSearch
+from .parsers import ImageMultiPartParser
 from .permissions import IsAuthorOrReadOnly
+from .relations import UserRelations, apply_user_relations
+from .renderers import ShoppingListCSVRenderer, ShoppingListTextRenderer
+from .search import ingredient_index
 from .serializers import (BuyListSerializer, CustomUserCreateSerializer,
                           CustomUserSerializer, FavoriteSerializer,
-                          IngredientsSerializer, RecipeSerializer,
-                          SubscriptionSerializer, TagSerializer)
-from .utils import get_ingredients_for_download
+                          IngredientsSerializer, RecipeBatchSerializer,
+                          RecipeSerializer, SubscriptionSerializer,
+                          TagSerializer)
+from .utils import (SHOPPING_LIST_WRITERS, get_recipes_etag,
+                    get_shopping_cart_etag)
 
 User = get_user_model()
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Обработчик запросов к ингредиентам. Поиск по началу имени (?name=)
+    выполняется по индексу в памяти процесса, без запроса к БД.
+    Параметр fuzzy=1 дополняет результат похожими именами (опечатки),
+    limit ограничивает число найденных ингредиентов.
+    Полный список отдается заранее отрисованным, см. api.catalog.
+    """
+
     queryset = Ingredient.objects.all()
     serializer_class = IngredientsSerializer
-    filter_backends = (IngredientsSearch, )
     pagination_class = None
 
+    def _get_search_limit(self):
+        limit = self.request.query_params.get('limit')
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            return INGREDIENT_SEARCH_LIMIT
+        return min(max(limit, 1), MAX_INGREDIENT_SEARCH_LIMIT)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            if request.accepted_renderer.format == 'json':
+                return ingredients_catalog.get_response(request)
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_index.search(
+            name,
+            limit=self._get_search_limit(),
+            fuzzy=request.query_params.get('fuzzy') == '1'))
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    """Обработчик запросов к тегам. Список отдается заранее отрисованным."""
+
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == 'json':
+            return tags_catalog.get_response(request)
+        return super().list(request, *args, **kwargs)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
+    """
+    Обработчик запросов к рецептам. Ответы на list и retrieve кэшируются
+    с версиями рецептов, авторов и тегов, из которых они собраны.
+    Избранное, корзина и подписки пользователя накладываются на данные
+    из кэша отдельно.
+    """
+
     queryset = Recipe.objects.select_related('author').prefetch_related(
-        'tag', 'ingredient').all()
+        'tag', 'recipe_ingredients__ingredient'
+    ).defer('search_document', 'search_vector')
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthorOrReadOnly,)
+    parser_classes = (JSONParser, ImageMultiPartParser, FormParser)
     filter_backends = (DjangoFilterBackend, OrderingFilter,
-                       CustomFilterBackend)
+                       CustomFilterBackend, RecipeSearch)
     filterset_class = RecipeFilter
-    ordering_fields = ('pub_date')
-    ordering = ('-pub_date',)
+    ordering_fields = ('pub_date', 'favorites_count')
+    ordering = ('-pub_date', 'id')
+    cursor_ordering = ordering
 
-    def get_queryset(self):
-        if not self.request.user.is_authenticated:
-            return super().get_queryset()
-
-        queryset = super().get_queryset().annotate(
-            is_favorited=Exists(
-                Favorite.objects.filter(
-                    user=self.request.user,
-                    recipe_id=OuterRef('pk')
-                )
-            ),
-            is_in_shopping_cart=Exists(
-                BuyList.objects.filter(
-                    user=self.request.user,
-                    recipe_id=OuterRef('pk')
-                )
-            )
-        )
-        return queryset
+    def get_serializer_context(self):
+        """
+        Для list и retrieve тело ответа собирается без данных пользователя,
+        чтобы его можно было кэшировать. Флаги пользователя накладываются
+        на готовые данные. В списке фото отдается в размере карточки.
+        """
+
+        context = super().get_serializer_context()
+        if self.action in ('list', 'retrieve'):
+            context['user_relations'] = UserRelations()
+        if self.action == 'list':
+            context['image_variant'] = 'card'
+        return context
+
+    def _is_cacheable(self, request):
+        ordering = {
+            field.strip().lstrip('-')
+            for value in request.query_params.getlist('ordering')
+            for field in value.split(',')
+        }
+        return (set(request.query_params) <= CACHEABLE_RECIPE_PARAMS
+                and not ordering & UNCACHEABLE_ORDERING_FIELDS)
+
+    def _get_page_validators(self, page):
+        """
+        Данные для ETag страницы: общее число рецептов (в режиме курсора -
+        есть ли следующая страница) и пары (id, время изменения).
+        """
+
+        if self.paginator.cursor_mode:
+            total = self.paginator.next_instance is not None
+        else:
+            total = self.paginator.page.paginator.count
+        return total, [(recipe.id, recipe.modified) for recipe in page]
+
+    def _build_list(self):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        serializer = self.get_serializer(page, many=True)
+        return (self.get_paginated_response(serializer.data).data,
+                self._get_page_validators(page))
+
+    def _get_list_validators(self):
+        """Та же страница без сериализации: только id и время изменения."""
+
+        queryset = self.filter_queryset(self.get_queryset()).select_related(
+            None).prefetch_related(None).only('id', 'modified', 'pub_date')
+        return self._get_page_validators(self.paginate_queryset(queryset))
+
+    def _get_not_modified(self, request, etag, last_modified=None):
+        """304 без тела, если копия клиента совпадает с текущей."""
+
+        if get_conditional_response(
+                request, etag=etag, last_modified=last_modified) is None:
+            return None
+        return self._set_validators(
+            Response(status=status.HTTP_304_NOT_MODIFIED),
+            etag, last_modified)
+
+    def _set_validators(self, response, etag, last_modified=None):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        ETag страницы считается по id и времени изменения ее рецептов
+        и хранится в кэше вместе с ответом. Если ответа в кэше нет,
+        а клиент прислал If-None-Match, он сначала сверяется с легким
+        запросом страницы: на совпадение 304 отдается без сериализации.
+        """
+
+        cacheable = self._is_cacheable(request)
+        entry = None
+        if cacheable:
+            key = get_response_cache_key(request, 'recipes-page')
+            entry = get_cached_response(key)
+        if entry is None and request.META.get('HTTP_IF_NONE_MATCH'):
+            total, recipes = self._get_list_validators()
+            not_modified = self._get_not_modified(
+                request, get_recipes_etag(request.user, recipes, total))
+            if not_modified is not None:
+                return not_modified
+        if entry is None:
+            entry = self._build_list()
+            if cacheable:
+                dependencies = get_recipe_dependencies(entry[0]['results'])
+                dependencies.add(RECIPES_VERSION_KEY)
+                set_cached_response(key, entry, dependencies)
+
+        data, (total, recipes) = entry
+        etag = get_recipes_etag(request.user, recipes, total)
+        not_modified = self._get_not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        if request.user.is_authenticated:
+            apply_user_relations(data['results'], UserRelations(request.user))
+        return self._set_validators(Response(data), etag)
+
+    def _get_recipe_validators(self, recipe_id, modified):
+        """
+        Флаги пользователя не меняют время изменения рецепта,
+        поэтому Last-Modified отдается только анонимным клиентам.
+        """
+
+        etag = get_recipes_etag(self.request.user, [(recipe_id, modified)])
+        if self.request.user.is_authenticated:
+            return etag, None
+        return etag, int(modified.timestamp())
+
+    def _build_detail(self):
+        recipe = self.get_object()
+        return self.get_serializer(recipe).data, recipe.modified
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Время изменения рецепта хранится в кэше вместе с ответом. Если
+        ответа в кэше нет, а клиент прислал условные заголовки, время
+        читается одним запросом по первичному ключу: на совпадение
+        304 отдается без сериализации.
+        """
+
+        cacheable = self._is_cacheable(request)
+        entry = None
+        if cacheable:
+            key = f'recipe-detail:{kwargs[self.lookup_field]}'
+            entry = get_cached_response(key)
+        if entry is None and any(request.META.get(header)
+                                 for header in CONDITIONAL_HEADERS):
+            recipe = get_object_or_404(Recipe.objects.only('modified'),
+                                       pk=kwargs[self.lookup_field])
+            not_modified = self._get_not_modified(
+                request,
+                *self._get_recipe_validators(recipe.id, recipe.modified))
+            if not_modified is not None:
+                return not_modified
+        if entry is None:
+            entry = self._build_detail()
+            if cacheable:
+                set_cached_response(
+                    key, entry, get_recipe_dependencies([entry[0]]))
+
+        data, modified = entry
+        validators = self._get_recipe_validators(data['id'], modified)
+        not_modified = self._get_not_modified(request, *validators)
+        if not_modified is not None:
+            return not_modified
+        if request.user.is_authenticated:
+            apply_user_relations([data], UserRelations(request.user))
+        return self._set_validators(Response(data), *validators)
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -92,8 +286,11 @@ class BaseAddRecipeViewSet(mixins.CreateModelMixin, mixins.DestroyModelMixin,
     def destroy(self, request, recipe_id):
         user = request.user
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        instance = get_object_or_404(self.queryset, user=user, recipe=recipe)
-        instance.delete()
+        with transaction.atomic():
+            lock_user(user)
+            instance = get_object_or_404(self.queryset, user=user,
+                                         recipe=recipe)
+            instance.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -111,25 +308,79 @@ class BuyListViewSet(BaseAddRecipeViewSet):
     serializer_class = BuyListSerializer
 
 
+class BaseBatchRecipeView(APIView):
+    """
+    Пакетное добавление (POST) и удаление (DELETE) рецептов в избранное,
+    корзину и т.п. одной транзакцией. В теле запроса - {"recipes": [id]},
+    в ответе - статус для каждого id.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    model = None
+
+    def _get_recipe_ids(self, request):
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
+
+    def _respond(self, statuses):
+        return Response({'results': [
+            {'id': recipe_id, 'status': recipe_status}
+            for recipe_id, recipe_status in statuses.items()
+        ]})
+
+    def post(self, request):
+        return self._respond(add_recipes(
+            self.model, request.user, self._get_recipe_ids(request)))
+
+    def delete(self, request):
+        return self._respond(remove_recipes(
+            self.model, request.user, self._get_recipe_ids(request)))
+
+
+class FavoriteBatchView(BaseBatchRecipeView):
+    """Пакетное добавление и удаление рецептов в избранном."""
+
+    model = Favorite
+
+
+class BuyListBatchView(BaseBatchRecipeView):
+    """Пакетное добавление и удаление рецептов в корзине."""
+
+    model = BuyList
+
+
 class DownloadShoppingCart(APIView):
     """
     Обработчик выгрузки рецептов из корзины.
-    Выдает response с текстовым файлом.
+    Отдает файл потоком в формате txt, csv или json (?format=).
+    Ответ помечается ETag по версии корзины: повторная выгрузка
+    неизменной корзины с If-None-Match получает 304 без агрегации.
+    Суммы читаются из заранее посчитанной таблицы CartIngredient.
     """
 
     permission_classes = (IsAuthenticated,)
+    renderer_classes = (ShoppingListTextRenderer, ShoppingListCSVRenderer,
+                        JSONRenderer)
 
     def get(self, request):
         user = self.request.user
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__buylist__user=user
-        ).values('ingredient__name', 'ingredient__measurement_unit').annotate(
-            amount=Sum('amount')
-        )
-        response_content: str = get_ingredients_for_download(ingredients)
-        response = HttpResponse(response_content, content_type='text/plain')
-        response[
-            'Content-Disposition'] = 'attachment; filename="ingredients.txt"'
+        file_format = request.accepted_renderer.format
+        etag = get_shopping_cart_etag(user, file_format)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        ingredients = CartIngredient.objects.filter(user=user).values(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name')
+        response = StreamingHttpResponse(
+            SHOPPING_LIST_WRITERS[file_format](ingredients.iterator()),
+            content_type=(f'{request.accepted_renderer.media_type}; '
+                          'charset=utf-8'))
+        response['Content-Disposition'] = (
+            f'attachment; filename="ingredients.{file_format}"')
+        response['ETag'] = etag
         return response
 
 
@@ -160,16 +411,40 @@ class SubscriptionViewSet(mixins.ListModelMixin, mixins.CreateModelMixin,
 
     serializer_class = SubscriptionSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    cursor_ordering = ('id',)
+
+    def _get_recipes_limit(self):
+        try:
+            recipes_limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+        return recipes_limit if recipes_limit >= 0 else None
 
     def get_queryset(self):
+        """
+        Рецепты авторов загружаются одним запросом. Номер рецепта автора
+        считается в БД через ROW_NUMBER() OVER (PARTITION BY author_id),
+        поэтому загружается не больше recipes_limit рецептов на автора.
+        """
+
         authors = self.request.user.subscribers.values('author').all()
-        return User.objects.filter(id__in=authors).prefetch_related('recipes')
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
+            'author_id')
+        recipes_limit = self._get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.annotate(row_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').asc()),
+            )).filter(row_number__lte=recipes_limit)
+        return User.objects.filter(id__in=authors).prefetch_related(
+            Prefetch('recipes', queryset=recipes))
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         author_id = self.kwargs.get('author_id')
-        context['recipes_limit'] = self.request.query_params.get(
-            'recipes_limit')
+        context['recipes_limit'] = self._get_recipes_limit()
         if author_id:
             context['author'] = get_object_or_404(User, id=author_id)
         context['user'] = self.request.user
@@ -0,0 +1,18 @@
+from django.test.runner import DiscoverRunner
+
+BENCHMARK_TAG = 'benchmark'
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Микробенчмарки с тегом benchmark долгие и зависят от машины,
+    поэтому по умолчанию пропускаются. Запуск только их:
+    python manage.py test --tag benchmark
+    """
+
+    def __init__(self, *args, tags=None, exclude_tags=None, **kwargs):
+        exclude_tags = set(exclude_tags or ())
+        if BENCHMARK_TAG not in (tags or ()):
+            exclude_tags.add(BENCHMARK_TAG)
+        super().__init__(*args, tags=tags, exclude_tags=exclude_tags,
+                         **kwargs)
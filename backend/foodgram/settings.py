@@ -24,6 +24,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework.authtoken',
     'rest_framework',
     'django_filters',
@@ -41,6 +42,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.QueryCountMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -74,6 +76,18 @@ DATABASES = {
     },
 }
 
+# Версии данных в кэше сбрасываются и веб-воркерами, и командами
+# управления (загрузка ингредиентов, импорт рецептов), поэтому при
+# развертывании кэш должен быть общим для всех процессов: в контейнерах
+# это Redis (CACHE_BACKEND и CACHE_LOCATION в .env). Кэш в памяти
+# по умолчанию - для разработки и тестов на одном процессе.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -103,6 +117,24 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Число потоков обработки изображений рецептов. При 0 обработка
+# выполняется синхронно после коммита транзакции.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Заголовки с числом и временем запросов к БД (api.middleware) для
+# нагрузочного теста bench_api. Не включать в рабочем окружении.
+QUERY_COUNT_HEADERS = os.getenv('QUERY_COUNT_HEADERS') == '1'
+
+TEST_RUNNER = 'foodgram.runner.TestRunner'
+
+# Микробенчмарки (python manage.py test --tag benchmark): файл с базовыми
+# временами и допустимое замедление относительно них (0.25 - на 25%).
+# Базовые времена записываются, если файла нет или BENCHMARK_UPDATE=1.
+BENCHMARK_BASELINE = os.getenv(
+    'BENCHMARK_BASELINE', os.path.join(BASE_DIR, 'benchmarks.json'))
+BENCHMARK_THRESHOLD = float(os.getenv('BENCHMARK_THRESHOLD', 0.25))
+BENCHMARK_UPDATE = os.getenv('BENCHMARK_UPDATE') == '1'
+
 DEFAULT_CHARSET = 'utf-8'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
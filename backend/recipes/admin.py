@@ -27,12 +27,12 @@ class AdminIngredientRecipeInline(admin.TabularInline):
 class AdminRecipe(admin.ModelAdmin):
     form = RecipeForm
     inlines = [AdminIngredientRecipeInline]
-    list_display = ('id', 'name', 'author')
+    list_display = ('id', 'name', 'author', 'favorites_count')
     list_filter = ('name', 'author', 'tag')
     readonly_fields = ('id', 'total_favorite_count',)
 
     def total_favorite_count(self, obj):
-        return obj.favorite_set.count()
+        return obj.favorites_count
 
     total_favorite_count.short_description = ('Количество добавлений'
                                               ' в избранное')
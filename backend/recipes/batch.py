@@ -0,0 +1,79 @@
+from typing import Dict, Iterable
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .models import Recipe
+from .signals import batch_delete, recipe_relations_changed
+
+User = get_user_model()
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+
+
+def lock_user(user) -> None:
+    """
+    Блокирует пользователя до конца транзакции. Все изменения избранного
+    и корзины (пакетные и по одному рецепту) берут эту блокировку, поэтому
+    строки, прочитанные пакетом, не меняются до его записи.
+    """
+
+    list(User.objects.select_for_update().filter(
+        id=user.id).values_list('id'))
+
+
+def add_recipes(model, user, recipe_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Добавляет рецепты в избранное или корзину (model) одним INSERT.
+    Возвращает статус для каждого id: added, exists или not_found.
+    """
+
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    with transaction.atomic():
+        lock_user(user)
+        found = set(Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', flat=True))
+        present = set(model.objects.filter(
+            user=user, recipe_id__in=found).values_list('recipe_id',
+                                                        flat=True))
+        added = found - present
+        model.objects.bulk_create(
+            (model(user=user, recipe_id=recipe_id) for recipe_id in added),
+            ignore_conflicts=True)
+        if added:
+            recipe_relations_changed.send(
+                sender=model, user_id=user.id, recipe_ids=added, delta=1)
+    return {
+        recipe_id: (ADDED if recipe_id in added
+                    else EXISTS if recipe_id in present else NOT_FOUND)
+        for recipe_id in recipe_ids
+    }
+
+
+def remove_recipes(model, user,
+                   recipe_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Удаляет рецепты из избранного или корзины (model). Обработчики
+    удаления строк пропускают такое удаление: счетчики, корзина и кэш
+    обновляются одним сигналом recipe_relations_changed.
+    Возвращает статус для каждого id: removed или absent.
+    """
+
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    with transaction.atomic():
+        lock_user(user)
+        rows = model.objects.filter(user=user, recipe_id__in=recipe_ids)
+        removed = set(rows.values_list('recipe_id', flat=True))
+        if removed:
+            with batch_delete():
+                rows.delete()
+            recipe_relations_changed.send(
+                sender=model, user_id=user.id, recipe_ids=removed, delta=-1)
+    return {
+        recipe_id: REMOVED if recipe_id in removed else ABSENT
+        for recipe_id in recipe_ids
+    }
@@ -0,0 +1,142 @@
+from collections import Counter
+from typing import Dict, Iterable, Tuple
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import BuyList, CartIngredient, IngredientRecipe
+
+User = get_user_model()
+
+
+def get_recipe_amounts(recipe_id: int) -> Dict[int, int]:
+    """Количество каждого ингредиента в рецепте."""
+
+    return dict(IngredientRecipe.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+
+def change_cart_amounts(user_ids: Iterable[int],
+                        deltas: Dict[int, int]) -> None:
+    """
+    Прибавляет к количеству ингредиентов в корзинах пользователей
+    значения из deltas (id ингредиента: изменение). Строки с нулевым
+    количеством удаляются. Строки пользователей блокируются, чтобы
+    параллельные изменения одной корзины не теряли обновления, поэтому
+    новые количества считаются в Python и пишутся пакетно.
+    """
+
+    user_ids = list(user_ids)
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not user_ids or not deltas:
+        return
+
+    with transaction.atomic():
+        list(User.objects.select_for_update().filter(
+            id__in=user_ids).values_list('id'))
+        rows = list(CartIngredient.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=deltas))
+        existing = set()
+        for row in rows:
+            row.amount += deltas[row.ingredient_id]
+            existing.add((row.user_id, row.ingredient_id))
+        CartIngredient.objects.bulk_update(
+            [row for row in rows if row.amount > 0], ('amount',))
+        empty = [row.id for row in rows if row.amount <= 0]
+        if empty:
+            CartIngredient.objects.filter(id__in=empty).delete()
+        CartIngredient.objects.bulk_create(
+            CartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=delta)
+            for user_id in user_ids
+            for ingredient_id, delta in deltas.items()
+            if delta > 0 and (user_id, ingredient_id) not in existing)
+
+
+def add_recipe_to_cart(user_id: int, recipe_id: int, sign: int = 1) -> None:
+    """Добавляет ингредиенты рецепта в корзину пользователя."""
+
+    amounts = get_recipe_amounts(recipe_id)
+    change_cart_amounts(
+        [user_id], {key: sign * amount for key, amount in amounts.items()})
+
+
+def remove_recipe_from_cart(user_id: int, recipe_id: int) -> None:
+    """Вычитает ингредиенты рецепта из корзины пользователя."""
+
+    add_recipe_to_cart(user_id, recipe_id, sign=-1)
+
+
+def change_recipes_in_cart(user_id: int, recipe_ids: Iterable[int],
+                           sign: int) -> None:
+    """Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецептов."""
+
+    amounts = IngredientRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values('ingredient_id').annotate(total=Sum('amount')).order_by()
+    change_cart_amounts([user_id], {
+        row['ingredient_id']: sign * row['total'] for row in amounts})
+
+
+def change_recipe_in_carts(recipe_id: int, deltas: Dict[int, int]) -> None:
+    """Применяет изменение ингредиентов рецепта ко всем корзинам с ним."""
+
+    if any(deltas.values()):
+        change_cart_amounts(BuyList.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True), deltas)
+
+
+def get_amounts_delta(old: Dict[int, int],
+                      new: Dict[int, int]) -> Dict[int, int]:
+    """Разница количеств ингредиентов рецепта до и после изменения."""
+
+    delta = Counter(new)
+    delta.subtract(old)
+    return dict(delta)
+
+
+def get_live_cart_amounts() -> Dict[Tuple[int, int], int]:
+    """Количества ингредиентов в корзинах, посчитанные по рецептам."""
+
+    return {
+        (row['recipe__buylist__user'], row['ingredient']): row['total']
+        for row in IngredientRecipe.objects.filter(
+            recipe__buylist__isnull=False
+        ).values('recipe__buylist__user', 'ingredient').annotate(
+            total=Sum('amount')
+        ).order_by()
+    }
+
+
+def find_cart_mismatches() -> Dict[Tuple[int, int], Tuple[int, int]]:
+    """
+    Сравнивает сохраненные количества с живой агрегацией.
+    Возвращает {(пользователь, ингредиент): (сохранено, должно быть)}.
+    """
+
+    stored = {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in
+        CartIngredient.objects.values_list('user_id', 'ingredient_id',
+                                           'amount')
+    }
+    live = get_live_cart_amounts()
+    return {
+        key: (stored.get(key, 0), live.get(key, 0))
+        for key in stored.keys() | live.keys()
+        if stored.get(key, 0) != live.get(key, 0)
+    }
+
+
+def rebuild_cart_ingredients() -> int:
+    """Полностью пересобирает таблицу по живой агрегации."""
+
+    with transaction.atomic():
+        CartIngredient.objects.all().delete()
+        created = CartIngredient.objects.bulk_create(
+            CartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=amount)
+            for (user_id, ingredient_id), amount in
+            get_live_cart_amounts().items())
+    return len(created)
@@ -8,3 +8,27 @@ MIN_COOKING_TIME = 1
 MAX_AMOUNT_INGREDIENT = 3000
 MIN_AMOUNT_INGREDIENT = 1
 STR_REPR_LEN = 20
+SEARCH_CONFIG = 'russian'
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+IMAGE_VARIANTS = {
+    'thumbnail': 240,
+    'card': 640,
+    'full': 1600,
+}
+IMAGE_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+IMAGE_QUALITY = 82
+IMAGE_VARIANTS_DIR = 'recipes/images/variants/'
+# Файлы фото без ImageBlob моложе этого возраста (секунды) не удаляются:
+# транзакция, которая их записала, может быть еще не завершена.
+ORPHAN_IMAGE_MIN_AGE = 60 * 60
+IMPORT_BATCH_SIZE = 500
+IMPORT_WORKERS = 4
+INGREDIENTS_BATCH_SIZE = 1000
+SEED_BATCH_SIZE = 5000
+SEED_ZIPF_EXPONENT = 1.0
+# Число строк в одном UPDATE при пересборке индекса и отпечатков.
+RECIPE_UPDATE_BATCH_SIZE = 1000
@@ -0,0 +1,68 @@
+from typing import Dict, Iterable, Tuple
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from users.models import Subscription
+
+from .models import BuyList, Favorite, Recipe
+
+User = get_user_model()
+
+# Поле-счетчик модели: (модель, поле, модель связи, поле связи).
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'carts_count', BuyList, 'recipe'),
+)
+
+
+def change_counter(model, pk: int, field: str, delta: int) -> None:
+    """Атомарно изменяет счетчик в БД, не опуская его ниже нуля."""
+
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks: Iterable[int], field: str,
+                    delta: int) -> None:
+    """Изменяет счетчик сразу у нескольких строк одним UPDATE."""
+
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def count_related(related_model, related_field: str) -> Coalesce:
+    """Подзапрос с количеством связанных записей для каждой строки."""
+
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def rebuild_counters() -> Dict[Tuple[str, str], int]:
+    """
+    Пересчитывает все счетчики одним UPDATE на счетчик.
+    Возвращает количество обновленных строк для каждого счетчика.
+    """
+
+    updated = {}
+    for model, field, related_model, related_field in COUNTERS:
+        updated[model.__name__, field] = model.objects.update(
+            **{field: count_related(related_model, related_field)})
+    return updated
+
+
+def find_counter_mismatches() -> Dict[Tuple[str, str], int]:
+    """Возвращает количество строк с неверным значением каждого счетчика."""
+
+    mismatches = {}
+    for model, field, related_model, related_field in COUNTERS:
+        mismatches[model.__name__, field] = model.objects.annotate(
+            actual=count_related(related_model, related_field)
+        ).exclude(**{field: F('actual')}).count()
+    return mismatches
@@ -0,0 +1,50 @@
+import hashlib
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from .constants import RECIPE_UPDATE_BATCH_SIZE
+from .models import Recipe
+
+
+def get_fingerprint(name: str, tag_ids: Iterable[int]) -> str:
+    """
+    Отпечаток рецепта для поиска дубликатов: название без учета
+    регистра и лишних пробелов и отсортированный набор id тегов.
+    """
+
+    normalized = ' '.join(name.split()).casefold()
+    tags = ','.join(map(str, sorted(set(tag_ids))))
+    return hashlib.sha256(f'{normalized}\n{tags}'.encode()).hexdigest()
+
+
+def update_fingerprints(recipe_ids: Iterable[int]) -> None:
+    """Пересчитывает отпечатки рецептов после изменения названия или тегов."""
+
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+
+    tags = defaultdict(list)
+    for recipe_id, tag_id in Recipe.tag.through.objects.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', 'tag_id'):
+        tags[recipe_id].append(tag_id)
+    changed = []
+    for recipe_id, name, fingerprint in Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', 'name', 'fingerprint'):
+        new_fingerprint = get_fingerprint(name, tags[recipe_id])
+        if new_fingerprint != fingerprint:
+            changed.append(Recipe(id=recipe_id, fingerprint=new_fingerprint))
+    Recipe.objects.bulk_update(changed, ('fingerprint',),
+                               batch_size=RECIPE_UPDATE_BATCH_SIZE)
+
+
+def find_duplicate(author, name: str, tag_ids: Iterable[int],
+                   exclude_id: Optional[int] = None) -> Optional[Recipe]:
+    """
+    Рецепт автора с тем же названием и тем же набором тегов.
+    Поиск идет по индексу (автор, отпечаток), без соединения с тегами.
+    """
+
+    return Recipe.objects.filter(
+        author=author, fingerprint=get_fingerprint(name, tag_ids)
+    ).exclude(id=exclude_id).first()
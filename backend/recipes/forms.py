@@ -1,5 +1,6 @@
 from django import forms
 
+from .duplicates import find_duplicate
 from .exceptions import (DuplicateIngredientException,
                          DuplicateRecipeException, MissingAmountException,
                          MissingIngredientException, MissingSelectionException,
@@ -31,10 +32,9 @@ class RecipeForm(forms.ModelForm):
         tags = self.cleaned_data.get('tag')
         recipe_id = self.instance.id
 
-        duplicate = Recipe.objects.filter(
-            author=author,
-            name=recipe_name,
-            tag__in=tags).exclude(id=recipe_id).first()
+        duplicate = find_duplicate(author, recipe_name,
+                                   [tag.id for tag in tags],
+                                   exclude_id=recipe_id)
         if duplicate:
             raise DuplicateRecipeException(duplicate=duplicate)
 
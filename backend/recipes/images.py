@@ -0,0 +1,147 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .constants import IMAGE_FORMATS, IMAGE_QUALITY, IMAGE_VARIANTS
+from .models import ImageBlob, Recipe
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Пул потоков создается при первом обращении, а не при импорте:
+    так каждый воркер gunicorn после fork получает собственный пул.
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='recipe-images')
+    return _executor
+
+
+def wait_for_image_processing() -> None:
+    """Дожидается обработки поставленных в очередь фото и закрывает пул."""
+
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def get_image_storage():
+    """Хранилище поля image: копии лежат там же, где и оригиналы."""
+
+    return Recipe._meta.get_field('image').storage
+
+
+def render_variants(image_name: str) -> Dict[str, Dict[str, str]]:
+    """
+    Строит уменьшенные копии изображения во всех форматах:
+    поворачивает по EXIF, вписывает в квадрат варианта и сохраняет
+    рядом с оригиналом. Возвращает {вариант: {формат: имя файла}}.
+    Копии, уже построенные для этого файла, не строятся заново.
+    """
+
+    storage = get_image_storage()
+    variants = {
+        variant: {
+            image_format: storage.get_variant_name(
+                image_name, variant, extension)
+            for image_format, (_, extension) in IMAGE_FORMATS.items()
+        }
+        for variant in IMAGE_VARIANTS
+    }
+    if all(storage.exists(name) for files in variants.values()
+           for name in files.values()):
+        return variants
+    with storage.open(image_name) as file:
+        source = ImageOps.exif_transpose(Image.open(file))
+        source = source.convert('RGB')
+    for variant, max_side in IMAGE_VARIANTS.items():
+        image = source.copy()
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        for image_format, (pil_format, _) in IMAGE_FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, pil_format, quality=IMAGE_QUALITY)
+            storage.save_as(variants[variant][image_format],
+                            ContentFile(buffer.getvalue()))
+    return variants
+
+
+def process_recipe_image(recipe_id: int) -> None:
+    """
+    Обрабатывает текущее изображение рецепта. Если за время обработки
+    рецепт удалили или заменили изображение, результат отбрасывается.
+    """
+
+    try:
+        recipe = Recipe.objects.only('image', 'image_variants').get(
+            id=recipe_id)
+        image_name = recipe.image.name
+        variants = render_variants(image_name)
+        with transaction.atomic():
+            recipe = Recipe.objects.select_for_update().only(
+                'image', 'image_variants').filter(id=recipe_id).first()
+            if recipe is None or recipe.image.name != image_name:
+                # Файл могли удалить до записи копий: тогда они ничьи.
+                if not ImageBlob.objects.filter(name=image_name).exists():
+                    get_image_storage().delete_variants(image_name)
+                return
+            recipe.image_variants = variants
+            recipe.modified = timezone.now()
+            recipe.save(update_fields=('image_variants', 'modified'))
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+
+
+def _process_in_worker(recipe_id: int) -> None:
+    try:
+        process_recipe_image(recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_processing(recipe_id: int) -> None:
+    """
+    Ставит изображение рецепта в очередь обработки после коммита
+    текущей транзакции: поток запроса не ждет кодирования Pillow.
+    """
+
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(_process_in_worker, recipe_id))
+    else:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
+
+
+def get_image_url(recipe: Recipe, variant: str,
+                  image_format: str = 'jpeg') -> str:
+    """Ссылка на вариант изображения, до обработки - на оригинал."""
+
+    name = recipe.image_variants.get(variant, {}).get(image_format)
+    return get_image_storage().url(name or recipe.image.name)
+
+
+def get_image_urls(recipe: Recipe) -> Dict[str, Dict[str, str]]:
+    return {
+        variant: {image_format: get_image_url(recipe, variant, image_format)
+                  for image_format in IMAGE_FORMATS}
+        for variant in IMAGE_VARIANTS
+    }
@@ -0,0 +1,34 @@
+"""
+Проверка таблицы сумм ингредиентов в корзинах (CartIngredient)
+по живой агрегации ингредиентов рецептов из корзин.
+python manage.py check_cart
+С флагом --fix таблица пересобирается, если найдены расхождения.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from recipes.cart import find_cart_mismatches, rebuild_cart_ingredients
+
+
+class Command(BaseCommand):
+    help = 'Проверка и пересборка сумм ингредиентов в корзинах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Пересобрать таблицу при расхождениях.')
+
+    def handle(self, *args, **options):
+        mismatches = find_cart_mismatches()
+        for (user_id, ingredient_id), (stored, live) in sorted(
+                mismatches.items()):
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'сохранено {stored}, должно быть {live}')
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Корзины корректны.'))
+            return
+        if not options['fix']:
+            raise CommandError(f'Расхождений в корзинах: {len(mismatches)}.')
+        created = rebuild_cart_ingredients()
+        self.stdout.write(self.style.SUCCESS(
+            f'Таблица пересобрана, строк: {created}.'))
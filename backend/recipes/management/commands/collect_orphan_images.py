@@ -0,0 +1,26 @@
+"""
+Удаление файлов фото, на которые нет строки ImageBlob, например
+после отката транзакции с загрузкой фото или прерванного импорта.
+python manage.py collect_orphan_images
+Файлы моложе часа не трогаются, возраст задается флагом --min-age.
+"""
+
+from django.core.management.base import BaseCommand
+from recipes.constants import ORPHAN_IMAGE_MIN_AGE
+from recipes.models import Recipe
+from recipes.storage import collect_orphan_images
+
+
+class Command(BaseCommand):
+    help = 'Удаление файлов фото без ссылок в ImageBlob.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=ORPHAN_IMAGE_MIN_AGE,
+            help='Минимальный возраст удаляемого файла в секундах.')
+
+    def handle(self, *args, **options):
+        directory = Recipe._meta.get_field('image').upload_to.rstrip('/')
+        collected = collect_orphan_images(directory, options['min_age'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов: {len(collected)}.'))
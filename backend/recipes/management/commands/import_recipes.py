@@ -0,0 +1,274 @@
+"""
+Потоковый импорт рецептов из файла JSON Lines, по рецепту на строку:
+python manage.py import_recipes recipes.jsonl
+Формат строки:
+{"author": "username", "name": "...", "text": "...", "cooking_time": 30,
+ "tags": ["breakfast"],
+ "ingredients": [{"name": "соль", "measurement_unit": "г", "amount": 5}],
+ "image": "data:image/png;base64,..."}
+Ингредиент можно указать по "id", фото - путем к файлу относительно
+--images-dir (по умолчанию - папка JSONL файла).
+Файл читается пакетами по --batch-size строк, фото пакета пишутся
+параллельно в --workers потоков. Рецепты, которые у автора уже есть
+с тем же названием, пропускаются. Номер последней сохраненной строки
+пишется в <файл>.progress, и прерванный импорт продолжается с нее;
+--restart начинает импорт с первой строки.
+"""
+
+import base64
+import binascii
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.constants import (IMPORT_BATCH_SIZE, IMPORT_WORKERS,
+                               MAX_AMOUNT_INGREDIENT, MAX_COOKING_TIME,
+                               MIN_AMOUNT_INGREDIENT, MIN_COOKING_TIME)
+from recipes.images import wait_for_image_processing
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from recipes.signals import recipes_imported
+from recipes.storage import acquire_images
+
+User = get_user_model()
+
+
+class RecordError(ValueError):
+    """Ошибка в строке файла импорта."""
+
+
+def check_range(name, value, min_value, max_value):
+    if not isinstance(value, int) or not min_value <= value <= max_value:
+        raise RecordError(f'Некорректное значение {name}: {value}.')
+    return value
+
+
+class Command(BaseCommand):
+    help = 'Потоковый импорт рецептов из JSONL файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('jsonl_file', type=str,
+                            help='Путь до JSONL файла.')
+        parser.add_argument('--batch-size', type=int,
+                            default=IMPORT_BATCH_SIZE,
+                            help='Число строк в одной транзакции.')
+        parser.add_argument('--workers', type=int, default=IMPORT_WORKERS,
+                            help='Число потоков записи фото.')
+        parser.add_argument('--images-dir', type=str, default=None,
+                            help='Папка с файлами фото.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать импорт с первой строки.')
+
+    def handle(self, *args, **options):
+        path = options['jsonl_file']
+        progress_path = f'{path}.progress'
+        self.images_dir = options['images_dir'] or os.path.dirname(
+            os.path.abspath(path))
+        self.image_field = Recipe._meta.get_field('image')
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name.casefold(), unit): ingredient_id
+            for ingredient_id, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit')
+        }
+        self.ingredient_ids = set(self.ingredients.values())
+        self.authors = {}
+        self.stats = Counter()
+
+        start = 0
+        if not options['restart'] and os.path.exists(progress_path):
+            with open(progress_path, encoding='utf-8') as file:
+                start = int(file.read() or 0)
+            self.stdout.write(f'Продолжение импорта со строки {start + 1}.')
+
+        started = time.monotonic()
+        with open(path, encoding='utf-8') as file, ThreadPoolExecutor(
+                options['workers']) as pool:
+            lines = islice(enumerate(file, start=1), start, None)
+            while batch := list(islice(lines, options['batch_size'])):
+                self._import_batch(batch, pool)
+                last_line = batch[-1][0]
+                with open(progress_path, 'w', encoding='utf-8') as progress:
+                    progress.write(str(last_line))
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Строк: {last_line}, создано: {self.stats["created"]}, '
+                    f'пропущено: {self.stats["skipped"]}, '
+                    f'ошибок: {self.stats["errors"]}, '
+                    f'{self.stats["created"] / elapsed:.1f} рецептов/с')
+
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        wait_for_image_processing()
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершен: создано {self.stats["created"]}, '
+            f'пропущено {self.stats["skipped"]}, '
+            f'ошибок {self.stats["errors"]}.'))
+
+    def _error(self, line_no, error):
+        self.stats['errors'] += 1
+        self.stderr.write(f'Строка {line_no}: {error}')
+
+    def _load_authors(self, records):
+        missing = {
+            record.get('author') for _, record in records
+            if isinstance(record.get('author'), str)
+        } - self.authors.keys()
+        self.authors.update(User.objects.filter(
+            username__in=missing).values_list('username', 'id'))
+
+    def _get_ingredient_id(self, item):
+        if 'id' in item:
+            ingredient_id = item['id']
+            if ingredient_id not in self.ingredient_ids:
+                raise RecordError(f'Нет ингредиента с id {ingredient_id}.')
+            return ingredient_id
+        key = (str(item.get('name', '')).casefold(),
+               item.get('measurement_unit'))
+        if key not in self.ingredients:
+            raise RecordError(f'Нет ингредиента {key[0]} ({key[1]}).')
+        return self.ingredients[key]
+
+    def _resolve(self, record):
+        """Проверяет запись и заменяет автора, теги и ингредиенты на id."""
+
+        for field in ('author', 'name', 'text', 'cooking_time', 'tags',
+                      'ingredients', 'image'):
+            if not record.get(field):
+                raise RecordError(f'Не заполнено поле {field}.')
+        if not isinstance(record['image'], str):
+            raise RecordError('Фото должно быть строкой.')
+        if record['author'] not in self.authors:
+            raise RecordError(f'Нет пользователя {record["author"]}.')
+        unknown_tags = set(record['tags']) - self.tags.keys()
+        if unknown_tags:
+            raise RecordError(f'Нет тегов {", ".join(sorted(unknown_tags))}.')
+        ingredients = {}
+        for item in record['ingredients']:
+            ingredient_id = self._get_ingredient_id(item)
+            if ingredient_id in ingredients:
+                raise RecordError('Ингредиенты повторяются.')
+            ingredients[ingredient_id] = check_range(
+                'amount', item.get('amount'),
+                MIN_AMOUNT_INGREDIENT, MAX_AMOUNT_INGREDIENT)
+        return {
+            'author_id': self.authors[record['author']],
+            'name': record['name'],
+            'text': record['text'],
+            'cooking_time': check_range(
+                'cooking_time', record['cooking_time'],
+                MIN_COOKING_TIME, MAX_COOKING_TIME),
+            'tag_ids': {self.tags[slug] for slug in record['tags']},
+            'ingredients': ingredients,
+            'image': record['image'],
+        }
+
+    def _store_image(self, image):
+        """Пишет фото в хранилище без обращения к БД, вызывается в потоках."""
+
+        storage = self.image_field.storage
+        if image.startswith('data:image'):
+            try:
+                header, data = image.split(';base64,')
+                content = ContentFile(
+                    base64.b64decode(data),
+                    name=f'image.{header.split("/")[-1]}')
+            except (ValueError, binascii.Error):
+                raise RecordError('Некорректное фото в base64.')
+            return storage.save_unlocked(self.image_field.generate_filename(
+                None, content.name), content)
+        try:
+            with open(os.path.join(self.images_dir, image), 'rb') as file:
+                return storage.save_unlocked(
+                    self.image_field.generate_filename(
+                        None, os.path.basename(image)), File(file))
+        except OSError as error:
+            raise RecordError(f'Не удалось прочитать фото: {error}.')
+
+    def _store_image_safe(self, image):
+        try:
+            return self._store_image(image)
+        except RecordError as error:
+            return error
+
+    def _import_batch(self, batch, pool):
+        records = []
+        for line_no, line in batch:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                records.append((line_no, record))
+            else:
+                self._error(line_no, 'Ожидается JSON объект.')
+        self._load_authors(records)
+
+        resolved = []
+        for line_no, record in records:
+            try:
+                resolved.append((line_no, self._resolve(record)))
+            except RecordError as error:
+                self._error(line_no, error)
+            except (AttributeError, TypeError):
+                self._error(line_no, 'Некорректная структура записи.')
+
+        existing = set(Recipe.objects.filter(
+            author_id__in={record['author_id'] for _, record in resolved},
+            name__in={record['name'] for _, record in resolved},
+        ).values_list('author_id', 'name'))
+        new = []
+        for line_no, record in resolved:
+            key = (record['author_id'], record['name'])
+            if key in existing:
+                self.stats['skipped'] += 1
+                continue
+            existing.add(key)
+            new.append((line_no, record))
+
+        images = pool.map(self._store_image_safe,
+                          [record['image'] for _, record in new])
+        sources = {}
+        recipes = []
+        for (line_no, record), image in zip(new, images):
+            if isinstance(image, RecordError):
+                self._error(line_no, image)
+                continue
+            sources[image] = record['image']
+            record['image'] = image
+            recipes.append(record)
+        if not recipes:
+            return
+
+        with transaction.atomic():
+            missing = acquire_images(
+                Counter(record['image'] for record in recipes))
+            for name in missing:
+                self._store_image(sources[name])
+            created = Recipe.objects.bulk_create(
+                Recipe(author_id=record['author_id'], name=record['name'],
+                       text=record['text'],
+                       cooking_time=record['cooking_time'],
+                       image=record['image'])
+                for record in recipes)
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe_id=recipe.id,
+                                 ingredient_id=ingredient_id, amount=amount)
+                for recipe, record in zip(created, recipes)
+                for ingredient_id, amount in record['ingredients'].items())
+            Recipe.tag.through.objects.bulk_create(
+                Recipe.tag.through(recipe_id=recipe.id, tag_id=tag_id)
+                for recipe, record in zip(created, recipes)
+                for tag_id in record['tag_ids'])
+            recipes_imported.send(sender=self.__class__,
+                                  recipe_ids=[recipe.id for recipe in created])
+        self.stats['created'] += len(created)
@@ -1,39 +1,236 @@
 """
-Чтение данных из *.json файлов и их запись в БД.
+Загрузка каталога ингредиентов из *.json или *.csv файла в БД.
 Данные загружаются командой:
-python python manage.py parse_json 'path'
-path - путь до файла *.json
+python manage.py parse_json 'path'
+path - путь до файла *.json (список объектов с полями name
+и measurement_unit) или *.csv (строки "название,единица").
 Если данные находятся в папке data на две директории выше,
 то команда будет такой:
 python manage.py parse_json ../data/ingredients.json
+Файл читается потоком и записывается пакетами по --batch-size строк,
+поэтому повторная загрузка того же каталога ничего не меняет.
+--on-conflict skip (по умолчанию) пропускает уже загруженные
+ингредиенты, update - дополнительно исправляет написание названия
+существующего ингредиента, если оно отличается от файла только
+регистром или пробелами.
+--copy на PostgreSQL загружает файл через COPY во временную таблицу
+и переносит его в каталог двумя запросами: быстрее для больших каталогов.
 """
 
+import csv
+import io
 import json
 import os
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.constants import INGREDIENTS_BATCH_SIZE
 from recipes.models import Ingredient
+from recipes.signals import ingredients_loaded
+
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def normalize_name(name):
+    return ' '.join(name.split()).casefold()
+
+
+def iter_json_array(file):
+    """Отдает элементы JSON массива по одному, читая файл порциями."""
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != '[':
+                raise CommandError('Ожидается JSON массив.')
+            started = True
+            position += 1
+            continue
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            if eof:
+                raise CommandError('Некорректный JSON.')
+            chunk = file.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+
+
+def iter_rows(path):
+    """Пары (название, единица измерения) из JSON или CSV файла."""
+
+    with open(path, encoding='utf-8', newline='') as file:
+        items = (csv.reader(file) if path.endswith('.csv')
+                 else iter_json_array(file))
+        for item in items:
+            if isinstance(item, dict):
+                item = (item.get('name'), item.get('measurement_unit'))
+            if not item:
+                continue
+            if len(item) != 2 or not all(
+                    isinstance(value, str) and value.strip()
+                    for value in item):
+                raise CommandError(f'Некорректная запись: {item}.')
+            yield item[0].strip(), item[1].strip()
+
+
+class CSVStream:
+    """Файлоподобный объект для COPY: строки CSV формируются по запросу."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ''
+        self.count = 0
+
+    def _line(self, row):
+        line = io.StringIO()
+        csv.writer(line).writerow(row)
+        self.count += 1
+        return line.getvalue()
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += self._line(row)
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
 
 
 class Command(BaseCommand):
-    help = 'Загрузка данных из json файла в модель Ingredients.'
+    help = 'Загрузка ингредиентов из json или csv файла в модель Ingredient.'
 
     def add_arguments(self, parser):
-        parser.add_argument('json_file', type=str, help='Путь до JSON файла.')
+        parser.add_argument('json_file', type=str,
+                            help='Путь до JSON или CSV файла.')
+        parser.add_argument('--batch-size', type=int,
+                            default=INGREDIENTS_BATCH_SIZE,
+                            help='Число строк в одном пакете.')
+        parser.add_argument('--on-conflict', choices=('skip', 'update'),
+                            default='skip',
+                            help='Что делать с уже загруженными.')
+        parser.add_argument('--copy', action='store_true',
+                            help='Загрузка через COPY (только PostgreSQL).')
 
     def handle(self, *args, **options):
-        json_file = options['json_file']
-        absolute_path = os.path.abspath(json_file)
-        self.stdout.write(f'Parsing JSON file: {absolute_path}')
-
-        with open(json_file, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-
-        # Создание списка объектов модели для bulk_create
-        objects_to_create = [
-            Ingredient(name=item['name'],
-                       measurement_unit=item['measurement_unit'])
-            for item in data
-        ]
-        Ingredient.objects.bulk_create(objects_to_create)
-        self.stdout.write(self.style.SUCCESS('Данные загружены в БД.'))
+        path = options['json_file']
+        self.stdout.write(f'Parsing file: {os.path.abspath(path)}')
+        update = options['on_conflict'] == 'update'
+        if options['copy']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--copy доступен только на PostgreSQL.')
+            total, inserted, updated_ids = self._load_copy(path, update)
+        else:
+            total, inserted, updated_ids = self._load_batches(
+                path, options['batch_size'], update)
+
+        if inserted or updated_ids:
+            ingredients_loaded.send(sender=self.__class__,
+                                    updated_ids=updated_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные загружены в БД. Добавлено: {inserted}, '
+            f'обновлено: {len(updated_ids)}, '
+            f'пропущено: {total - inserted - len(updated_ids)}.'))
+
+    def _load_batches(self, path, batch_size, update):
+        """
+        Для update держит в памяти ключи каталога: поиск по названию
+        без учета регистра не работает через индекс на всех СУБД.
+        """
+
+        self.catalog = {}
+        self.existing = set()
+        if update:
+            for ingredient_id, name, unit in Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'):
+                self.catalog[normalize_name(name), unit] = ingredient_id
+                self.existing.add((name, unit))
+        total = inserted = 0
+        updated_ids = []
+        batch = []
+        for row in iter_rows(path):
+            batch.append(row)
+            if len(batch) == batch_size:
+                inserted += self._save_batch(batch, update, updated_ids)
+                total += len(batch)
+                batch = []
+        if batch:
+            inserted += self._save_batch(batch, update, updated_ids)
+            total += len(batch)
+        return total, inserted, updated_ids
+
+    def _save_batch(self, batch, update, updated_ids):
+        if not update:
+            self.existing = set(Ingredient.objects.filter(
+                name__in={name for name, _ in batch}
+            ).values_list('name', 'measurement_unit'))
+        new = {}
+        changed = {}
+        for name, unit in batch:
+            if (name, unit) in self.existing:
+                continue
+            self.existing.add((name, unit))
+            ingredient_id = self.catalog.get((normalize_name(name), unit))
+            if ingredient_id is None:
+                new[name, unit] = Ingredient(name=name,
+                                             measurement_unit=unit)
+            elif ingredient_id not in changed:
+                changed[ingredient_id] = Ingredient(
+                    id=ingredient_id, name=name, measurement_unit=unit)
+
+        with transaction.atomic():
+            Ingredient.objects.bulk_create(new.values(),
+                                           ignore_conflicts=True)
+            Ingredient.objects.bulk_update(changed.values(), ('name',))
+        updated_ids.extend(changed)
+        return len(new)
+
+    def _load_copy(self, path, update):
+        table = Ingredient._meta.db_table
+        stream = CSVStream(iter_rows(path))
+        normalized = "lower(regexp_replace(btrim({}), '\\s+', ' ', 'g'))"
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_staging '
+                '(name text, measurement_unit text) ON COMMIT DROP')
+            cursor.copy_expert(
+                'COPY ingredient_staging (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', stream)
+            updated_ids = []
+            if update:
+                cursor.execute(
+                    f'UPDATE {table} AS i SET name = s.name '
+                    f'FROM ingredient_staging AS s '
+                    f'WHERE {normalized.format("i.name")} = '
+                    f'{normalized.format("s.name")} '
+                    f'AND i.measurement_unit = s.measurement_unit '
+                    f'AND i.name <> s.name AND NOT EXISTS ('
+                    f'SELECT 1 FROM {table} AS j WHERE j.name = s.name '
+                    f'AND j.measurement_unit = s.measurement_unit) '
+                    f'RETURNING i.id')
+                updated_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT DISTINCT name, measurement_unit '
+                f'FROM ingredient_staging '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING')
+            inserted = cursor.rowcount
+        return stream.count, inserted, updated_ids
@@ -0,0 +1,30 @@
+"""
+Построение уменьшенных копий фото для уже загруженных рецептов.
+python manage.py process_recipe_images
+По умолчанию обрабатываются рецепты без копий, с флагом --all - все.
+"""
+
+from django.core.management.base import BaseCommand
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Построение уменьшенных копий фото рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии для всех рецептов.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        recipe_ids = list(recipes.values_list('id', flat=True))
+        for recipe_id in recipe_ids:
+            process_recipe_image(recipe_id)
+        processed = Recipe.objects.filter(id__in=recipe_ids).exclude(
+            image_variants={}).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {processed} из {len(recipe_ids)}.'))
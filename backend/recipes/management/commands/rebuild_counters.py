@@ -0,0 +1,34 @@
+"""
+Пересчет денормализованных счетчиков: рецептов и подписчиков автора,
+добавлений рецепта в избранное и в корзину.
+python manage.py rebuild_counters
+С флагом --check счетчики только проверяются, команда завершается
+с ошибкой, если найдены расхождения.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.counters import find_counter_mismatches, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчет и проверка счетчиков рецептов, подписок и избранного.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить счетчики, не изменяя их.')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                updated = rebuild_counters()
+            for (model, field), count in updated.items():
+                self.stdout.write(f'{model}.{field}: обновлено {count}')
+
+        mismatches = find_counter_mismatches()
+        for (model, field), count in mismatches.items():
+            self.stdout.write(f'{model}.{field}: расхождений {count}')
+        if any(mismatches.values()):
+            raise CommandError('Счетчики не совпадают с данными.')
+        self.stdout.write(self.style.SUCCESS('Счетчики корректны.'))
@@ -0,0 +1,234 @@
+"""
+Синтетический набор данных для нагрузочного тестирования:
+python manage.py seed_synthetic --users 100000 --recipes 1000000
+Создает пользователей, рецепты с тегами и ингредиентами, избранное,
+корзины и подписки. Популярность распределена по закону Ципфа
+(--zipf), данные порций строятся в --workers процессах и пишутся
+пакетами по --batch-size строк через bulk_create. Один и тот же
+--seed на пустой БД дает один и тот же набор данных.
+Фото рецептов - --images заглушек, каждая хранится один раз.
+Пароль всех созданных пользователей - --password.
+Если каталог ингредиентов или тегов пуст, он заполняется синтетическими.
+В конце пересчитываются счетчики и суммы ингредиентов в корзинах.
+Созданные данные отправляют те же сигналы, что и import_recipes
+и parse_json, поэтому поисковый индекс и кэши API обновляются.
+"""
+
+import os
+import random
+import time
+from collections import Counter
+from io import BytesIO
+from multiprocessing import Pool
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from recipes.cart import rebuild_cart_ingredients
+from recipes.constants import SEED_BATCH_SIZE, SEED_ZIPF_EXPONENT
+from recipes.counters import rebuild_counters
+from recipes.duplicates import get_fingerprint
+from recipes.models import (BuyList, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, Tag)
+from recipes.signals import ingredients_loaded, recipes_imported
+from recipes.storage import acquire_images
+from recipes.synthetic import Params, generate_pairs, generate_recipes
+from users.models import Subscription
+
+User = get_user_model()
+
+SYNTHETIC_INGREDIENTS = 2000
+SYNTHETIC_TAGS = 10
+RELATIONS = {
+    'favorites': Favorite,
+    'carts': BuyList,
+    'subscriptions': Subscription,
+}
+
+
+class Command(BaseCommand):
+    help = 'Синтетические данные для нагрузочного тестирования.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8,
+                            help='Среднее число ингредиентов рецепта.')
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--subscriptions', type=int, default=20000)
+        parser.add_argument('--images', type=int, default=20,
+                            help='Число разных фото-заглушек.')
+        parser.add_argument('--zipf', type=float, default=SEED_ZIPF_EXPONENT,
+                            help='Показатель распределения Ципфа.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=SEED_BATCH_SIZE,
+                            help='Число строк в одной порции.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Число процессов генерации.')
+        parser.add_argument('--prefix', default='synthetic',
+                            help='Префикс имен пользователей.')
+        parser.add_argument('--password', default='synthetic-password')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['recipes'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и рецепт.')
+        if User.objects.filter(
+                username__startswith=options['prefix']).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {options["prefix"]} уже есть.')
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        self.ingredient_ids = self._get_catalog(
+            Ingredient, SYNTHETIC_INGREDIENTS,
+            lambda i: Ingredient(name=f'Синтетический ингредиент {i}',
+                                 measurement_unit='г'),
+            loaded=ingredients_loaded)
+        self.tag_ids = self._get_catalog(
+            Tag, SYNTHETIC_TAGS,
+            lambda i: Tag(name=f'Тег {i}', color=f'#{i:06X}',
+                          slug=f'synthetic-{i}'))
+        self.images = self._create_images(options['images'], options['seed'])
+        params = Params(
+            seed=options['seed'], users=options['users'],
+            recipes=options['recipes'],
+            ingredients=len(self.ingredient_ids), tags=len(self.tag_ids),
+            images=len(self.images),
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            exponent=options['zipf'])
+
+        self.user_ids = self._create_users(
+            options['users'], options['prefix'], options['password'])
+        self.recipe_ids = []
+        with Pool(options['workers']) as pool:
+            tasks = [(params, chunk, start,
+                      min(start + self.batch_size, params.recipes))
+                     for chunk, start in enumerate(
+                         range(0, params.recipes, self.batch_size))]
+            self._run('Рецепты', params.recipes, pool.imap(
+                generate_recipes, tasks), self._save_recipes)
+            for kind, model in RELATIONS.items():
+                self.saved_pairs = set()
+                tasks = [(params, kind, chunk,
+                          min(self.batch_size, options[kind] - start))
+                         for chunk, start in enumerate(
+                             range(0, options[kind], self.batch_size))]
+                self._run(model._meta.verbose_name_plural, options[kind],
+                          pool.imap(generate_pairs, tasks),
+                          lambda pairs, kind=kind: self._save_pairs(
+                              kind, pairs))
+
+        self.stdout.write('Пересчет счетчиков и корзин.')
+        rebuild_counters()
+        rebuild_cart_ingredients()
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.1f} с.'))
+
+    def _get_catalog(self, model, size, build, loaded=None):
+        """
+        Пустой справочник заполняется синтетическими записями: через
+        bulk_create с сигналом loaded после него или, без сигнала,
+        по одной записи, чтобы сработали обработчики post_save.
+        """
+
+        ids = list(model.objects.order_by('id').values_list('id', flat=True))
+        if ids:
+            return ids
+        if loaded is not None:
+            model.objects.bulk_create(build(i) for i in range(size))
+            loaded.send(sender=self.__class__, updated_ids=())
+        else:
+            for i in range(size):
+                build(i).save()
+        return list(model.objects.order_by('id').values_list('id', flat=True))
+
+    def _create_images(self, count, seed):
+        """Заглушки одного цвета: одинаковые файлы хранятся один раз."""
+
+        rng = random.Random(f'{seed}:images')
+        field = Recipe._meta.get_field('image')
+        names = []
+        for _ in range(max(count, 1)):
+            buffer = BytesIO()
+            color = tuple(rng.randrange(256) for _ in range(3))
+            Image.new('RGB', (640, 480), color).save(buffer, 'JPEG')
+            names.append(field.storage.save_unlocked(
+                field.generate_filename(None, 'placeholder.jpg'),
+                ContentFile(buffer.getvalue())))
+        return names
+
+    def _create_users(self, count, prefix, password):
+        password = make_password(password)
+        user_ids = []
+        for start in range(0, count, self.batch_size):
+            users = User.objects.bulk_create(
+                User(username=f'{prefix}{i}',
+                     email=f'{prefix}{i}@example.com',
+                     first_name='Пользователь', last_name=str(i),
+                     password=password)
+                for i in range(start, min(start + self.batch_size, count)))
+            user_ids.extend(user.id for user in users)
+        self.stdout.write(f'Пользователи: {len(user_ids)}.')
+        return user_ids
+
+    def _run(self, title, total, batches, save):
+        started = time.monotonic()
+        done = 0
+        for batch in batches:
+            done += save(batch)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{title}: {done} из {total}, '
+                              f'{done / elapsed:.0f} строк/с')
+
+    def _save_recipes(self, rows):
+        with transaction.atomic():
+            acquire_images(Counter(self.images[row.image] for row in rows))
+            created = Recipe.objects.bulk_create(
+                Recipe(author_id=self.user_ids[row.author], name=row.name,
+                       text=row.text, cooking_time=row.cooking_time,
+                       image=self.images[row.image],
+                       fingerprint=get_fingerprint(
+                           row.name, [self.tag_ids[tag] for tag in row.tags]))
+                for row in rows)
+            IngredientRecipe.objects.bulk_create(
+                (IngredientRecipe(recipe_id=recipe.id,
+                                  ingredient_id=self.ingredient_ids[position],
+                                  amount=amount)
+                 for recipe, row in zip(created, rows)
+                 for position, amount in row.ingredients),
+                batch_size=self.batch_size)
+            Recipe.tag.through.objects.bulk_create(
+                Recipe.tag.through(recipe_id=recipe.id,
+                                   tag_id=self.tag_ids[tag])
+                for recipe, row in zip(created, rows) for tag in row.tags)
+            recipes_imported.send(
+                sender=self.__class__,
+                recipe_ids=[recipe.id for recipe in created],
+                process_images=False)
+        self.recipe_ids.extend(recipe.id for recipe in created)
+        return len(created)
+
+    def _save_pairs(self, kind, pairs):
+        """
+        Пары из разных порций могут совпадать, повторы отбрасываются до
+        вставки. Пользователи созданы этим же запуском, поэтому других
+        совпадений в БД нет и возвращается число созданных строк.
+        """
+
+        pairs = [pair for pair in pairs if pair not in self.saved_pairs]
+        self.saved_pairs.update(pairs)
+        model = RELATIONS[kind]
+        if kind == 'subscriptions':
+            objects = (Subscription(user_id=self.user_ids[user],
+                                    author_id=self.user_ids[author])
+                       for user, author in pairs)
+        else:
+            objects = (model(user_id=self.user_ids[user],
+                             recipe_id=self.recipe_ids[recipe])
+                       for user, recipe in pairs)
+        model.objects.bulk_create(objects, ignore_conflicts=True)
+        return len(pairs)
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.4 on 2026-10-18 04:30
+
+from collections import defaultdict
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models import TextField, Value
+
+INDEX_NAME = 'recipe_search_vector_idx'
+SEARCH_CONFIG = 'russian'
+
+
+def fill_search_fields(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    labels = defaultdict(list)
+    tags = Recipe.tag.through.objects.values_list('recipe_id', 'tag__name')
+    ingredients = IngredientRecipe.objects.values_list(
+        'recipe_id', 'ingredient__name')
+    for recipe_id, label in (*tags, *ingredients):
+        labels[recipe_id].append(label)
+
+    is_postgres = schema_editor.connection.vendor == 'postgresql'
+    for recipe_id, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text'):
+        recipe_labels = ' '.join(labels[recipe_id])
+        fields = {'search_document': '\n'.join(
+            (name, recipe_labels, text)).casefold()}
+        if is_postgres:
+            fields['search_vector'] = (
+                SearchVector(Value(name, output_field=TextField()),
+                             weight='A', config=SEARCH_CONFIG)
+                + SearchVector(Value(recipe_labels, output_field=TextField()),
+                               weight='B', config=SEARCH_CONFIG)
+                + SearchVector(Value(text, output_field=TextField()),
+                               weight='C', config=SEARCH_CONFIG))
+        Recipe.objects.filter(id=recipe_id).update(**fields)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        'ON recipes_recipe USING gin (search_vector)')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_ingredient_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Поисковый документ'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(fill_search_fields, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.4 on 2026-10-18 04:48
+
+import recipes.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_image_blobs(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ImageBlob = apps.get_model('recipes', 'ImageBlob')
+    ImageBlob.objects.bulk_create(
+        ImageBlob(name=row['image'], refs=row['refs'])
+        for row in Recipe.objects.exclude(image='').values('image').annotate(
+            refs=Count('id')).order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл фото',
+                'verbose_name_plural': 'Файлы фото',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.get_recipe_image_storage, upload_to='recipes/images/', verbose_name='Фото'),
+        ),
+        migrations.RunPython(fill_image_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.4 on 2026-10-18 05:03
+
+import hashlib
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def get_fingerprint(name, tag_ids):
+    normalized = ' '.join(name.split()).casefold()
+    tags = ','.join(map(str, sorted(set(tag_ids))))
+    return hashlib.sha256(f'{normalized}\n{tags}'.encode()).hexdigest()
+
+
+def fill_fingerprints(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    tags = defaultdict(list)
+    for recipe_id, tag_id in Recipe.tag.through.objects.values_list(
+            'recipe_id', 'tag_id'):
+        tags[recipe_id].append(tag_id)
+    recipes = [
+        Recipe(id=recipe_id, fingerprint=get_fingerprint(name, tags[recipe_id]))
+        for recipe_id, name in Recipe.objects.values_list('id', 'name')
+    ]
+    Recipe.objects.bulk_update(recipes, ('fingerprint',), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Отпечаток названия и тегов'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'fingerprint'], name='recipe_author_fingerprint_idx'),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,16 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.db.models import UniqueConstraint
+from django.utils import timezone
 
 from .constants import (CHARS_MAX_LEN, HEX_COLOR_MAX_LEN,
                         MAX_AMOUNT_INGREDIENT, MAX_COOKING_TIME,
                         MEASUREMENT_UNIT_MAX_LEN, MIN_AMOUNT_INGREDIENT,
                         MIN_COOKING_TIME, RECIPE_NAME_MAX_LEN,
                         RECIPE_TEXT_MAX_LEN, STR_REPR_LEN)
+from .storage import get_recipe_image_storage
 from .validators import validate_hex_color
 
 User = get_user_model()
@@ -101,9 +104,16 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=get_recipe_image_storage,
         blank=False,
         verbose_name='Фото'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии фото'
+    )
     tag = models.ManyToManyField(
         to=Tag,
         related_name='recipes',
@@ -123,11 +133,58 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    modified = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        verbose_name='Дата изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество добавлений в избранное'
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество добавлений в корзину'
+    )
+    fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Отпечаток названия и тегов'
+    )
+    search_document = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Поисковый документ'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
 
     class Meta:
         ordering = ('-pub_date', 'id',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=('-pub_date', 'id'),
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', 'fingerprint'),
+                name='recipe_author_fingerprint_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name[:STR_REPR_LEN]
@@ -210,3 +267,55 @@ class BuyList(BaseUserRecipeRelation):
         constraints = [UniqueConstraint(
             fields=('user', 'recipe'),
             name='unique_user_and_buylist_recipe')]
+
+
+class CartIngredient(models.Model):
+    """
+    Суммарное количество ингредиента по всем рецептам в корзине
+    пользователя. Обновляется при изменении корзины и ингредиентов
+    рецептов, см. recipes.cart.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_ingredients',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Ингредиент корзины'
+        verbose_name_plural = 'Ингредиенты корзин'
+        constraints = [UniqueConstraint(
+            fields=('user', 'ingredient'),
+            name='unique_user_cart_ingredient')]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} — {self.amount}'
+
+
+class ImageBlob(models.Model):
+    """Файл фото рецепта и число рецептов, которые на него ссылаются."""
+
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файл'
+    )
+    refs = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок'
+    )
+
+    class Meta:
+        verbose_name = 'Файл фото'
+        verbose_name_plural = 'Файлы фото'
+
+    def __str__(self):
+        return f'{self.name} ({self.refs})'
@@ -0,0 +1,15 @@
+from typing import Iterable
+
+from django.utils import timezone
+
+from .models import Recipe
+
+
+def touch_recipes(recipe_ids: Iterable[int]) -> None:
+    """
+    Обновляет время изменения рецептов (Recipe.modified), по которому
+    строятся ETag и Last-Modified. Вызывается при любом изменении данных,
+    входящих в ответ рецепта: его полей, тегов, ингредиентов и автора.
+    """
+
+    Recipe.objects.filter(id__in=recipe_ids).update(modified=timezone.now())
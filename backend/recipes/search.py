@@ -0,0 +1,61 @@
+from collections import defaultdict
+from typing import Iterable
+
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+from django.db.models import TextField, Value
+
+from .constants import RECIPE_UPDATE_BATCH_SIZE, SEARCH_CONFIG
+from .models import IngredientRecipe, Recipe
+
+
+def get_search_vector(name: str, labels: str, text: str) -> SearchVector:
+    """
+    Вектор для полнотекстового поиска: название важнее тегов
+    и ингредиентов, они важнее описания.
+    """
+
+    return (
+        SearchVector(Value(name, output_field=TextField()),
+                     weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Value(labels, output_field=TextField()),
+                       weight='B', config=SEARCH_CONFIG)
+        + SearchVector(Value(text, output_field=TextField()),
+                       weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_index(recipe_ids: Iterable[int]) -> None:
+    """
+    Пересобирает поисковый документ рецептов из названия, описания,
+    тегов и ингредиентов. На PostgreSQL обновляет и tsvector.
+    """
+
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+
+    labels = defaultdict(list)
+    tags = Recipe.tag.through.objects.filter(
+        recipe_id__in=recipe_ids).values_list('recipe_id', 'tag__name')
+    ingredients = IngredientRecipe.objects.filter(
+        recipe_id__in=recipe_ids).values_list('recipe_id', 'ingredient__name')
+    for recipe_id, label in (*tags, *ingredients):
+        labels[recipe_id].append(label)
+
+    is_postgres = connection.vendor == 'postgresql'
+    recipes = []
+    for recipe_id, name, text in Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', 'name', 'text'):
+        recipe_labels = ' '.join(labels[recipe_id])
+        recipe = Recipe(id=recipe_id, search_document='\n'.join(
+            (name, recipe_labels, text)).casefold())
+        if is_postgres:
+            recipe.search_vector = get_search_vector(
+                name, recipe_labels, text)
+        recipes.append(recipe)
+    fields = ['search_document']
+    if is_postgres:
+        fields.append('search_vector')
+    Recipe.objects.bulk_update(recipes, fields,
+                               batch_size=RECIPE_UPDATE_BATCH_SIZE)
@@ -0,0 +1,358 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from users.models import Subscription
+
+from .cart import (add_recipe_to_cart, change_recipe_in_carts,
+                   change_recipes_in_cart, get_amounts_delta,
+                   remove_recipe_from_cart)
+from .counters import change_counter, change_counters
+from .duplicates import update_fingerprints
+from .images import schedule_image_processing
+from .models import (BuyList, Favorite, Ingredient, IngredientRecipe, Recipe,
+                     Tag)
+from .modified import touch_recipes
+from .search import update_search_index
+from .storage import acquire_image, release_image
+
+User = get_user_model()
+
+RECIPE_RELATION_COUNTERS = {
+    Favorite: 'favorites_count',
+    BuyList: 'carts_count',
+}
+
+# Отправляется после массовой загрузки ингредиентов в обход save().
+# updated_ids - id ингредиентов, у которых изменилось название.
+ingredients_loaded = Signal()
+
+# Отправляется после массового добавления (delta=1) или удаления (delta=-1)
+# рецептов recipe_ids в избранное или корзину пользователя user_id
+# в обход save() и delete(). sender - модель связи.
+recipe_relations_changed = Signal()
+
+# Отправляется после массового создания рецептов recipe_ids через
+# bulk_create, например командой import_recipes. process_images=False -
+# фото не ставятся в очередь обработки (заглушки seed_synthetic).
+recipes_imported = Signal()
+
+
+_batch_delete = ContextVar('batch_delete', default=False)
+
+
+@contextmanager
+def batch_delete():
+    """
+    Удаление строк избранного и корзины пакетом (remove_recipes):
+    счетчики, корзину и кэш обновляют обработчики recipe_relations_changed,
+    поэтому обработчики удаления отдельных строк внутри блока пропускаются.
+    """
+
+    token = _batch_delete.set(True)
+    try:
+        yield
+    finally:
+        _batch_delete.reset(token)
+
+
+def is_batch_delete() -> bool:
+    return _batch_delete.get()
+
+
+@contextmanager
+def recipe_change(recipe):
+    """
+    Изменение рецепта из нескольких шагов: сохранение, теги, ингредиенты.
+    Обработчики шагов пропускают время изменения, поисковый индекс
+    и отпечаток рецепта, после успешного завершения они обновляются
+    один раз.
+    """
+
+    recipe._index_deferred = True
+    try:
+        yield recipe
+    finally:
+        recipe._index_deferred = False
+    touch_recipes([recipe.id])
+    update_search_index([recipe.id])
+    update_fingerprints([recipe.id])
+
+
+def is_index_deferred(instance) -> bool:
+    return getattr(instance, '_index_deferred', False)
+
+
+# Обработчики изменений данных, входящих в ответ рецепта, обновляют
+# отдельно время изменения рецептов (touch_recipes) и поисковый индекс.
+
+
+@receiver(pre_save, sender=Recipe)
+def set_recipe_modified(sender, instance, update_fields, **kwargs):
+    """Время изменения пишется тем же UPDATE, что и сам рецепт."""
+
+    if update_fields is None:
+        instance.modified = timezone.now()
+
+
+@receiver(post_save, sender=Recipe)
+def touch_partially_saved_recipe(sender, instance, update_fields, **kwargs):
+    if update_fields and 'modified' not in update_fields:
+        touch_recipes([instance.id])
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, update_fields, **kwargs):
+    if is_index_deferred(instance) or update_fields and set(
+            update_fields) <= {'image_variants', 'modified'}:
+        return
+    update_search_index([instance.id])
+
+
+@receiver(m2m_changed, sender=Recipe.tag.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        if not is_index_deferred(instance):
+            touch_recipes([instance.id])
+            update_search_index([instance.id])
+    elif pk_set:
+        touch_recipes(pk_set)
+        update_search_index(pk_set)
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    """
+    Удаления через queryset и каскад от рецепта пропускаются: рецепт
+    либо удален, либо его обновит код, удаливший строки.
+    """
+
+    origin = kwargs.get('origin', instance)
+    if origin is instance or isinstance(origin, Ingredient):
+        touch_recipes([instance.recipe_id])
+        update_search_index([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        recipe_ids = list(IngredientRecipe.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+        touch_recipes(recipe_ids)
+        update_search_index(recipe_ids)
+
+
+@receiver(ingredients_loaded)
+def loaded_ingredients_changed(sender, updated_ids=(), **kwargs):
+    if updated_ids:
+        recipe_ids = list(IngredientRecipe.objects.filter(
+            ingredient_id__in=updated_ids).values_list('recipe_id', flat=True))
+        touch_recipes(recipe_ids)
+        update_search_index(recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+def tag_changed(sender, instance, created, **kwargs):
+    if not created:
+        recipe_ids = list(instance.recipes.values_list('id', flat=True))
+        touch_recipes(recipe_ids)
+        update_search_index(recipe_ids)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_recipes(sender, instance, **kwargs):
+    instance._recipe_ids = list(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    recipe_ids = getattr(instance, '_recipe_ids', ())
+    touch_recipes(recipe_ids)
+    update_search_index(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_fingerprint(sender, instance, update_fields, **kwargs):
+    if is_index_deferred(instance) or (
+            update_fields and 'name' not in update_fields):
+        return
+    update_fingerprints([instance.id])
+
+
+@receiver(m2m_changed, sender=Recipe.tag.through)
+def update_recipe_tags_fingerprint(sender, instance, action, reverse, pk_set,
+                                   **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        if not is_index_deferred(instance):
+            update_fingerprints([instance.id])
+    elif pk_set:
+        update_fingerprints(pk_set)
+
+
+@receiver(post_delete, sender=Tag)
+def update_deleted_tag_fingerprints(sender, instance, **kwargs):
+    update_fingerprints(getattr(instance, '_recipe_ids', ()))
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields=None,
+                         **kwargs):
+    """Данные автора входят в ответ рецепта."""
+
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    touch_recipes(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Subscription)
+def increment_followers_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_followers_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'followers_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=BuyList)
+def increment_recipe_relation_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id,
+                       RECIPE_RELATION_COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=BuyList)
+def decrement_recipe_relation_count(sender, instance, **kwargs):
+    if is_batch_delete():
+        return
+    change_counter(Recipe, instance.recipe_id,
+                   RECIPE_RELATION_COUNTERS[sender], -1)
+
+
+@receiver(recipe_relations_changed)
+def change_recipe_relation_counts(sender, recipe_ids, delta, **kwargs):
+    change_counters(Recipe, recipe_ids, RECIPE_RELATION_COUNTERS[sender],
+                    delta)
+
+
+@receiver(post_save, sender=BuyList)
+def add_cart_ingredients(sender, instance, created, **kwargs):
+    if created:
+        add_recipe_to_cart(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=BuyList)
+def remove_cart_ingredients(sender, instance, **kwargs):
+    """
+    Вычитание выполняется до удаления: при каскаде от рецепта его
+    ингредиенты еще не удалены.
+    """
+
+    if is_batch_delete():
+        return
+    remove_recipe_from_cart(instance.user_id, instance.recipe_id)
+
+
+@receiver(recipe_relations_changed, sender=BuyList)
+def change_cart_ingredients(sender, user_id, recipe_ids, delta, **kwargs):
+    change_recipes_in_cart(user_id, recipe_ids, delta)
+
+
+@receiver(pre_save, sender=IngredientRecipe)
+def remember_recipe_ingredient(sender, instance, **kwargs):
+    instance._previous_amount = dict(IngredientRecipe.objects.filter(
+        pk=instance.pk).values_list('ingredient_id', 'amount')
+    ) if instance.pk else {}
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def update_cart_ingredient(sender, instance, **kwargs):
+    change_recipe_in_carts(instance.recipe_id, get_amounts_delta(
+        getattr(instance, '_previous_amount', {}),
+        {instance.ingredient_id: instance.amount}))
+
+
+@receiver(post_delete, sender=IngredientRecipe)
+def remove_cart_ingredient(sender, instance, **kwargs):
+    """
+    Как и для поиска, удаления через queryset и каскад пропускаются:
+    корзины обновляет код, удаливший строки, или BuyList.pre_delete.
+    """
+
+    if kwargs.get('origin', instance) is instance:
+        change_recipe_in_carts(instance.recipe_id,
+                               {instance.ingredient_id: -instance.amount})
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_image(sender, instance, update_fields, **kwargs):
+    if not instance.pk or (update_fields and 'image' not in update_fields):
+        instance._previous_image = instance.image.name
+        return
+    instance._previous_image = Recipe.objects.filter(
+        pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, created, **kwargs):
+    """Новое или замененное фото обрабатывается в пуле потоков."""
+
+    if created or instance.image.name != getattr(
+            instance, '_previous_image', instance.image.name):
+        schedule_image_processing(instance.id)
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe_image_refs(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_image', instance.image.name)
+    if created or instance.image.name != previous:
+        acquire_image(instance.image.name)
+        if not created:
+            release_image(previous)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    """Копии фото удаляются вместе с файлом, когда на него нет ссылок."""
+
+    release_image(instance.image.name)
+
+
+@receiver(recipes_imported)
+def update_imported_recipes(sender, recipe_ids, process_images=True,
+                            **kwargs):
+    """Поисковый индекс, отпечатки, счетчики авторов и обработка фото."""
+
+    update_search_index(recipe_ids)
+    update_fingerprints(recipe_ids)
+    authors = Recipe.objects.filter(id__in=recipe_ids).values(
+        'author_id').annotate(count=Count('id')).order_by()
+    for row in authors:
+        change_counter(User, row['author_id'], 'recipes_count', row['count'])
+    if process_images:
+        for recipe_id in recipe_ids:
+            schedule_image_processing(recipe_id)
@@ -0,0 +1,199 @@
+import hashlib
+import os
+import posixpath
+from datetime import timedelta
+from typing import Dict, List
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .constants import IMAGE_FORMATS, IMAGE_VARIANTS, IMAGE_VARIANTS_DIR
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла - SHA-256 его содержимого.
+    Повторная загрузка того же файла не пишет его заново, а возвращает
+    имя уже сохраненного. Строка ImageBlob блокируется на время записи,
+    чтобы файл не удалили параллельно (см. release_image). Файлы, чья
+    строка ImageBlob откатилась вместе с транзакцией, удаляет
+    collect_orphan_images.
+    """
+
+    def get_content_name(self, name, content):
+        """Имя, под которым content будет сохранен."""
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(posixpath.dirname(name), digest[:2],
+                              digest + extension)
+
+    def _prepare(self, name, content):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return self.get_content_name(self.generate_filename(name),
+                                     content), content
+
+    def save(self, name, content, max_length=None):
+        from .models import ImageBlob
+
+        name, content = self._prepare(name, content)
+        with transaction.atomic():
+            ImageBlob.objects.select_for_update().get_or_create(name=name)
+            if not self.exists(name):
+                self._save(name, content)
+        return name
+
+    def save_unlocked(self, name, content):
+        """
+        Сохраняет файл без блокировки ImageBlob, например из потоков
+        без доступа к БД. Вызывающий код учитывает ссылки через
+        acquire_images и перезаписывает файлы, которых к тому моменту нет.
+        """
+
+        name, content = self._prepare(name, content)
+        return self.save_as(name, content)
+
+    def save_as(self, name, content):
+        """Сохраняет файл ровно под именем name, если его еще нет."""
+
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if not self.exists(name):
+            saved = self._save(name, content)
+            if saved != name:
+                # Тот же файл параллельно записал другой поток.
+                self.delete(saved)
+        return name
+
+    def get_variant_name(self, name, variant, extension):
+        """
+        Имя уменьшенной копии файла name. Копии принадлежат файлу,
+        а не рецепту: рецепты с одним фото используют одни копии,
+        и удаляются они вместе с файлом (см. collect_image).
+        """
+
+        stem = posixpath.splitext(posixpath.basename(name))[0]
+        return f'{IMAGE_VARIANTS_DIR}{stem}-{variant}.{extension}'
+
+    def get_variant_names(self, name) -> List[str]:
+        return [self.get_variant_name(name, variant, extension)
+                for variant in IMAGE_VARIANTS
+                for _, extension in IMAGE_FORMATS.values()]
+
+    def delete_variants(self, name) -> None:
+        for variant_name in self.get_variant_names(name):
+            self.delete(variant_name)
+
+
+recipe_image_storage = ContentAddressedStorage()
+
+
+def get_recipe_image_storage():
+    return recipe_image_storage
+
+
+def acquire_image(name: str) -> None:
+    """Учитывает новую ссылку рецепта на файл."""
+
+    from .models import ImageBlob
+
+    if not name:
+        return
+    with transaction.atomic():
+        blob, _ = ImageBlob.objects.select_for_update().get_or_create(
+            name=name)
+        blob.refs = F('refs') + 1
+        blob.save(update_fields=('refs',))
+
+
+def acquire_images(refs: Dict[str, int]) -> List[str]:
+    """
+    Учитывает ссылки на несколько файлов ({имя: число ссылок}) пакетом.
+    Возвращает имена, файлов которых нет в хранилище: их нужно записать
+    заново до коммита, пока строки ImageBlob заблокированы.
+    """
+
+    from .models import ImageBlob
+
+    with transaction.atomic():
+        ImageBlob.objects.bulk_create(
+            (ImageBlob(name=name) for name in refs), ignore_conflicts=True)
+        blobs = list(ImageBlob.objects.select_for_update().filter(
+            name__in=refs))
+        for blob in blobs:
+            blob.refs += refs[blob.name]
+        ImageBlob.objects.bulk_update(blobs, ('refs',))
+        return [name for name in refs
+                if not recipe_image_storage.exists(name)]
+
+
+def release_image(name: str) -> None:
+    """
+    Снимает ссылку рецепта на файл. Файл без ссылок удаляется после
+    коммита, если к тому моменту на него снова никто не сослался.
+    """
+
+    from .models import ImageBlob
+
+    if name and ImageBlob.objects.filter(name=name, refs__gt=0).update(
+            refs=F('refs') - 1):
+        transaction.on_commit(lambda: collect_image(name))
+
+
+def collect_image(name: str) -> None:
+    from .models import ImageBlob
+
+    with transaction.atomic():
+        blob = ImageBlob.objects.select_for_update().filter(
+            name=name, refs=0).first()
+        if blob is not None:
+            recipe_image_storage.delete(name)
+            recipe_image_storage.delete_variants(name)
+            blob.delete()
+
+
+def collect_orphan_images(directory: str, min_age: int) -> List[str]:
+    """
+    Удаляет файлы каталога directory, на которые нет строки ImageBlob.
+    Так бывает, если транзакция с загрузкой фото откатилась: строка
+    ImageBlob откатывается вместе с ней, а записанный файл остается.
+    Файлы моложе min_age секунд пропускаются. Возвращает удаленные имена.
+    """
+
+    from .models import ImageBlob
+
+    if not recipe_image_storage.exists(directory):
+        return []
+    deadline = timezone.now() - timedelta(seconds=min_age)
+    directories, files = recipe_image_storage.listdir(directory)
+    names = [posixpath.join(directory, file) for file in files]
+    known = set(ImageBlob.objects.filter(name__in=names).values_list(
+        'name', flat=True))
+    collected = []
+    for name in names:
+        if name in known or recipe_image_storage.get_modified_time(
+                name) > deadline:
+            continue
+        with transaction.atomic():
+            # Своя строка блокирует параллельное сохранение того же файла.
+            blob, created = ImageBlob.objects.select_for_update(
+            ).get_or_create(name=name)
+            if created:
+                recipe_image_storage.delete(name)
+                blob.delete()
+                collected.append(name)
+    for subdirectory in directories:
+        path = posixpath.join(directory, subdirectory)
+        if posixpath.join(path, '') != IMAGE_VARIANTS_DIR:
+            collected += collect_orphan_images(path, min_age)
+    return collected
@@ -0,0 +1,124 @@
+"""
+Генерация синтетических данных для нагрузочного тестирования.
+Функции модуля не обращаются к БД и Django, поэтому выполняются
+в дочерних процессах. Каждая порция строится своим генератором
+случайных чисел от (seed, вида данных, номера порции): результат
+не зависит от числа процессов и повторяется при том же seed.
+Популярность авторов, рецептов, ингредиентов и тегов распределена
+по закону Ципфа: элемент с рангом k выбирается с весом 1 / k ** s.
+"""
+
+import random
+from functools import lru_cache
+from itertools import accumulate
+from typing import List, NamedTuple, Tuple
+
+DISHES = ('суп', 'салат', 'пирог', 'омлет', 'рагу', 'каша', 'запеканка',
+          'паста', 'плов', 'блины', 'котлеты', 'соус', 'десерт', 'хлеб')
+STYLES = ('по-домашнему', 'по-деревенски', 'по-итальянски',
+          'по-французски', 'по-восточному', 'на скорую руку', 'к празднику')
+SENTENCE = 'Смешайте ингредиенты и готовьте до готовности. '
+
+
+class Params(NamedTuple):
+    """Размеры набора данных и параметры распределений."""
+
+    seed: int
+    users: int
+    recipes: int
+    ingredients: int
+    tags: int
+    images: int
+    ingredients_per_recipe: int
+    exponent: float
+
+
+class RecipeRow(NamedTuple):
+    """Рецепт с номерами автора, тегов, ингредиентов и фото."""
+
+    author: int
+    name: str
+    text: str
+    cooking_time: int
+    tags: List[int]
+    ingredients: List[Tuple[int, int]]
+    image: int
+
+
+@lru_cache(maxsize=None)
+def zipf_cum_weights(size: int, exponent: float) -> List[float]:
+    """Накопленные веса рангов 0..size-1, считаются раз на процесс."""
+
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, size + 1)))
+
+
+def zipf_sample(rng: random.Random, size: int, exponent: float,
+                count: int = 1) -> List[int]:
+    return rng.choices(range(size), cum_weights=zipf_cum_weights(
+        size, exponent), k=count)
+
+
+def zipf_distinct(rng: random.Random, size: int, exponent: float,
+                  count: int) -> List[int]:
+    """count разных номеров: популярные встречаются чаще."""
+
+    count = min(count, size)
+    chosen = {}
+    while len(chosen) < count:
+        for position in zipf_sample(rng, size, exponent, count):
+            chosen.setdefault(position, None)
+    return list(chosen)[:count]
+
+
+def get_rng(params: Params, kind: str, chunk: int) -> random.Random:
+    return random.Random(f'{params.seed}:{kind}:{chunk}')
+
+
+def generate_recipes(task: Tuple[Params, int, int, int]) -> List[RecipeRow]:
+    """Рецепты с номерами start..end-1."""
+
+    params, chunk, start, end = task
+    rng = get_rng(params, 'recipes', chunk)
+    exponent = params.exponent
+    average = params.ingredients_per_recipe
+    rows = []
+    for number in range(start, end):
+        name = (f'{rng.choice(DISHES).capitalize()} {rng.choice(STYLES)} '
+                f'№{number + 1}')
+        tags = zipf_distinct(rng, params.tags, exponent,
+                             rng.randint(1, 3))
+        ingredients = zipf_distinct(
+            rng, params.ingredients, exponent,
+            rng.randint(max(1, average // 2), average + average // 2))
+        rows.append(RecipeRow(
+            author=zipf_sample(rng, params.users, exponent)[0],
+            name=name,
+            text=f'{name}. ' + SENTENCE * rng.randint(1, 20),
+            cooking_time=rng.randint(5, 180),
+            tags=tags,
+            ingredients=[(ingredient, rng.randint(1, 500))
+                         for ingredient in ingredients],
+            image=rng.randrange(params.images),
+        ))
+    return rows
+
+
+def generate_pairs(task: Tuple[Params, str, int, int]
+                   ) -> List[Tuple[int, int]]:
+    """
+    Пары для избранного и корзины (пользователь, рецепт) или подписок
+    (подписчик, автор). Активные пользователи и популярные рецепты
+    и авторы встречаются чаще, повторы и подписки на себя отбрасываются.
+    """
+
+    params, kind, chunk, count = task
+    rng = get_rng(params, kind, chunk)
+    right_size = (params.users if kind == 'subscriptions'
+                  else params.recipes)
+    left = zipf_sample(rng, params.users, params.exponent, count)
+    right = zipf_sample(rng, right_size, params.exponent, count)
+    pairs = dict.fromkeys(zip(left, right))
+    if kind == 'subscriptions':
+        return [(user, author) for user, author in pairs if user != author]
+    return list(pairs)
@@ -8,7 +8,8 @@ User = get_user_model()
 
 
 class CustomUserAdmin(UserAdmin):
-    list_display = ('id', 'email', 'username', 'first_name', 'last_name')
+    list_display = ('id', 'email', 'username', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count')
     list_filter = ('email', 'username')
 
 
@@ -37,6 +37,16 @@ class User(AbstractUser):
     password = models.CharField(
         max_length=CHARS_MAX_LEN,
         verbose_name='Пароль')
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
 
     class Meta:
         verbose_name = 'Пользователи'